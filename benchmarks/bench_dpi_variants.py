@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+複数解像度の書き出し時間の比較
+dpiごとにsavefigを呼ぶ場合と、export_dpi_variantsで1回だけ描画する場合を計測
+"""
+
+import sys
+import os
+import time
+import tempfile
+import numpy as np
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+
+# Import mpl_config from parent directory
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import mpl_config
+
+DPIS = (600, 300, 150)
+
+
+def make_figure():
+    """曲線・散布図・ヒートマップ・等高線を含むベンチマーク用の図"""
+    rng = np.random.default_rng(0)
+    fig, (ax1, ax2, ax3, ax4) = plt.subplots(1, 4)
+
+    t = np.linspace(0, 100, 300_000)
+    ax1.plot(t, np.sin(t) + 0.1 * rng.standard_normal(t.size))
+    ax1.set_title('Curve')
+
+    ax4.scatter(rng.normal(size=20_000), rng.normal(size=20_000), s=4, alpha=0.5)
+    ax4.set_title('Scatter')
+
+    x = np.linspace(-5, 5, 400)
+    X, Y = np.meshgrid(x, x)
+    ax2.imshow(np.sin(X) * np.cos(Y), cmap='viridis')
+    ax2.set_title('Heatmap')
+
+    ax3.contourf(X, Y, np.exp(-(X ** 2 + Y ** 2) / 4), levels=20)
+    ax3.set_title('Contour')
+    fig.tight_layout()
+    return fig
+
+
+def measure_separate(fig, directory: str) -> float:
+    """dpiごとにsavefigを呼んだ場合の時間（秒）"""
+    start = time.perf_counter()
+    for dpi in DPIS:
+        fig.savefig(os.path.join(directory, f'separate_{dpi}dpi.png'), dpi=dpi)
+    return time.perf_counter() - start
+
+
+def measure_variants(fig, directory: str) -> float:
+    """export_dpi_variantsで書き出した場合の時間（秒）"""
+    result = mpl_config.export_dpi_variants(
+        fig, os.path.join(directory, 'variants_{dpi}dpi.png'), dpis=DPIS)
+    return result['seconds']
+
+
+if __name__ == "__main__":
+    preset = sys.argv[1] if len(sys.argv) > 1 else 'paper'
+    mpl_config.apply_style(preset)
+    fig = make_figure()
+    with tempfile.TemporaryDirectory() as directory:
+        separate = min(measure_separate(fig, directory) for _ in range(3))
+        variants = min(measure_variants(fig, directory) for _ in range(3))
+    plt.close(fig)
+    print(f"[{preset}] dpi={', '.join(map(str, DPIS))}")
+    print(f"  savefig x{len(DPIS)}:         {separate * 1000:8.1f} ms")
+    print(f"  export_dpi_variants: {variants * 1000:8.1f} ms "
+          f"({(1 - variants / separate) * 100:.0f}% 短縮)")
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+errorbar_fast と ax.errorbar の速度比較
+各プリセットで図の作成から描画までの時間を計測
+"""
+
+import sys
+import os
+import time
+import numpy as np
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+
+# Import mpl_config from parent directory
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import mpl_config
+
+
+def measure(plot_func, n_points: int, repeat: int = 3) -> float:
+    """図の作成・エラーバー描画・レンダリングの最短時間（秒）"""
+    rng = np.random.default_rng(0)
+    x = rng.uniform(0, 10, n_points)
+    y = rng.normal(size=n_points)
+    xerr = rng.uniform(0, 0.2, n_points)
+    yerr = rng.uniform(0, 0.2, n_points)
+
+    best = np.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fig, ax = plt.subplots()
+        plot_func(ax, x, y, xerr, yerr)
+        fig.canvas.draw()
+        best = min(best, time.perf_counter() - start)
+        plt.close(fig)
+    return best
+
+
+def mpl_errorbar(ax, x, y, xerr, yerr):
+    ax.errorbar(x, y, xerr=xerr, yerr=yerr, fmt='o', markersize=6, capsize=5)
+
+
+def fast_errorbar(ax, x, y, xerr, yerr):
+    mpl_config.errorbar_fast(ax, x, y, xerr=xerr, yerr=yerr, fmt='o',
+                             markersize=6, capsize=5)
+
+
+if __name__ == "__main__":
+    for preset in mpl_config.list_presets():
+        mpl_config.apply_style(preset)
+        print(f"[{preset}]")
+        for n_points in (1_000, 10_000, 100_000):
+            t_mpl = measure(mpl_errorbar, n_points)
+            t_fast = measure(fast_errorbar, n_points)
+            print(f"  N={n_points:>7}: ax.errorbar {t_mpl * 1000:8.1f} ms, "
+                  f"errorbar_fast {t_fast * 1000:8.1f} ms "
+                  f"(x{t_mpl / t_fast:.2f})")
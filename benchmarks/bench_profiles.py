@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+描画プロファイルごとの描画時間とファイルサイズの比較
+各プロファイルでベンチマーク用の図をPNG・PDFに保存して計測
+"""
+
+import sys
+import os
+import io
+import time
+import numpy as np
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+
+# Import mpl_config from parent directory
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import mpl_config
+
+
+def make_figure():
+    """曲線・散布図・ヒートマップ・数式を含むベンチマーク用の図"""
+    rng = np.random.default_rng(0)
+    fig, ((ax1, ax2), (ax3, ax4)) = plt.subplots(2, 2)
+
+    t = np.linspace(0, 100, 1_000_000)
+    ax1.plot(t, np.sin(t) + 0.1 * rng.standard_normal(t.size), label='signal')
+    ax1.legend(loc='upper right')
+    ax1.set_title('1M-point curve')
+
+    ax2.scatter(rng.normal(size=20_000), rng.normal(size=20_000), s=4, alpha=0.5)
+    ax2.set_title('Scatter')
+
+    x = np.linspace(-5, 5, 400)
+    X, Y = np.meshgrid(x, x)
+    ax3.imshow(np.sin(X) * np.cos(Y), cmap='viridis')
+    ax3.set_title('Heatmap')
+
+    ax4.contourf(X, Y, np.exp(-(X ** 2 + Y ** 2) / 4), levels=20)
+    ax4.set_title(r'$\exp(-(x^2 + y^2) / 4)$')
+    fig.tight_layout()
+    return fig
+
+
+def measure(preset: str, profile: str, fmt: str, repeat: int = 3) -> tuple:
+    """最短の保存時間（秒）とファイルサイズ（バイト）"""
+    best, size = np.inf, 0
+    for _ in range(repeat):
+        with mpl_config.temp_style(preset, profile=profile):
+            fig = make_figure()
+            buffer = io.BytesIO()
+            start = time.perf_counter()
+            fig.savefig(buffer, format=fmt, dpi=150)
+            best = min(best, time.perf_counter() - start)
+            size = buffer.tell()
+            plt.close(fig)
+    return best, size
+
+
+if __name__ == "__main__":
+    preset = sys.argv[1] if len(sys.argv) > 1 else 'paper'
+    print(f"[{preset}] (dpi=150)")
+    for fmt in ('png', 'pdf'):
+        for profile in mpl_config.list_profiles():
+            seconds, size = measure(preset, profile, fmt)
+            print(f"  {fmt} {profile:>9}: {seconds * 1000:8.1f} ms, {size / 1024:8.1f} KiB")
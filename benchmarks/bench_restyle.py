@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+複数プリセットでの書き出し時間の比較
+プリセットごとに図を作り直す場合と、1つの図をrestyleで切り替える場合を計測
+"""
+
+import sys
+import os
+import time
+import tempfile
+import numpy as np
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+
+# Import mpl_config from parent directory
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import mpl_config
+
+PRESETS = ('paper', 'presentation', 'presentation_large')
+
+
+def make_figure():
+    """曲線・等高線・流線を含むベンチマーク用の図（作成に時間がかかる）"""
+    rng = np.random.default_rng(0)
+    fig, (ax1, ax2, ax3) = plt.subplots(1, 3)
+
+    t = np.linspace(0, 100, 100_000)
+    for k in range(3):
+        ax1.plot(t, np.sin(t + k) + 0.1 * rng.standard_normal(t.size), label=f'series {k}')
+    ax1.set_xlabel('Time')
+    ax1.legend()
+
+    x = np.linspace(-3, 3, 300)
+    X, Y = np.meshgrid(x, x)
+    Z = np.exp(-(X ** 2 + Y ** 2)) - np.exp(-((X - 1) ** 2 + (Y - 1) ** 2))
+    cs = ax2.contourf(X, Y, Z, levels=30)
+    ax2.contour(X, Y, Z, levels=10, colors='k')
+    fig.colorbar(cs, ax=ax2, label='Value')
+
+    ax3.streamplot(X, Y, -Y, X, density=2)
+    ax3.set_title('Flow')
+    return fig
+
+
+def measure_rebuild(directory: str) -> float:
+    """プリセットごとに図を作り直した場合の時間（秒）"""
+    start = time.perf_counter()
+    for preset in PRESETS:
+        with mpl_config.temp_style(preset):
+            fig = make_figure()
+            fig.savefig(os.path.join(directory, f'rebuild_{preset}.png'))
+        plt.close(fig)
+    return time.perf_counter() - start
+
+
+def measure_restyle(directory: str) -> float:
+    """1つの図をrestyleで切り替えた場合の時間（秒）"""
+    start = time.perf_counter()
+    with mpl_config.temp_style(PRESETS[0]):
+        fig = make_figure()
+    for preset in PRESETS:
+        mpl_config.restyle(fig, preset, from_preset=PRESETS[0])
+        with mpl_config.temp_style(preset):
+            fig.savefig(os.path.join(directory, f'restyle_{preset}.png'))
+    plt.close(fig)
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as directory:
+        rebuild = min(measure_rebuild(directory) for _ in range(3))
+        restyled = min(measure_restyle(directory) for _ in range(3))
+    print(f"presets={', '.join(PRESETS)}")
+    print(f"  作り直し x{len(PRESETS)}: {rebuild * 1000:8.1f} ms")
+    print(f"  restyle x{len(PRESETS)}:  {restyled * 1000:8.1f} ms "
+          f"({(1 - restyled / rebuild) * 100:.0f}% 短縮)")
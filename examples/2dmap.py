@@ -160,10 +160,8 @@ ax1.set_title('Detailed Contour')
 # 2. ベクトル場の可視化
 u = -np.sin(Y_adv)
 v = np.cos(X_adv)
-skip = 10  # ベクトル削間
-ax2.quiver(X_adv[::skip, ::skip], Y_adv[::skip, ::skip], 
-           u[::skip, ::skip], v[::skip, ::skip], 
-           alpha=0.7, scale=20)
+# 矢印の間隔はプリセットの図のサイズとdpiから自動で決まる
+mpl_config.quiver_auto(ax2, X_adv, Y_adv, u, v, alpha=0.7, scale=20)
 ax2.contour(X_adv, Y_adv, Z_adv, levels=10, alpha=0.3)
 ax2.set_xlabel('X Coordinate')
 ax2.set_ylabel('Y Coordinate')
@@ -171,7 +169,8 @@ ax2.set_title('Vector Field')
 ax2.set_aspect('equal')
 
 # 3. ストリームライン
-ax3.streamplot(X_adv, Y_adv, u, v, density=2, color='blue')
+# 積分済みの流線はキャッシュされ、他のプリセットで描き直すときに再利用される
+mpl_config.streamplot_cached(ax3, X_adv, Y_adv, u, v, density=2, color='blue')
 ax3.contour(X_adv, Y_adv, Z_adv, levels=10, alpha=0.3)
 ax3.set_xlabel('X Coordinate')
 ax3.set_ylabel('Y Coordinate')
@@ -52,7 +52,7 @@ ax.plot(x, y3, label='sin(2x)×exp(-x/8)',
 ax.set_xlabel('Time (s)')
 ax.set_ylabel('Amplitude')
 ax.set_title('Damped Oscillation Comparison (paper preset)')
-ax.legend()
+mpl_config.legend(ax)
 ax.grid(True, alpha=plt.rcParams['grid.alpha'])
 
 # 軸範囲の設定
@@ -81,7 +81,7 @@ ax.plot(x, y3, label='sin(2x)×exp(-x/8)',
 ax.set_xlabel('Time (s)')
 ax.set_ylabel('Amplitude')
 ax.set_title('Damped Oscillation Comparison (presentation preset)')
-ax.legend()
+mpl_config.legend(ax)
 ax.grid(True, alpha=plt.rcParams['grid.alpha'])
 
 ax.set_xlim(0, 10)
@@ -108,7 +108,7 @@ ax.plot(x, y3, label='sin(2x)×exp(-x/8)',
 ax.set_xlabel('Time (s)')
 ax.set_ylabel('Amplitude')
 ax.set_title('Damped Oscillation Comparison (presentation_large preset)')
-ax.legend()
+mpl_config.legend(ax)
 ax.grid(True, alpha=plt.rcParams['grid.alpha'])
 
 ax.set_xlim(0, 10)
@@ -60,7 +60,7 @@ ax1.scatter(cluster3_x, cluster3_y, alpha=0.7, label='Cluster 3', s=50)
 ax1.set_xlabel('X Coordinate')
 ax1.set_ylabel('Y Coordinate')
 ax1.set_title('Cluster Analysis')
-ax1.legend()
+mpl_config.legend(ax1)
 ax1.grid(True, alpha=plt.rcParams['grid.alpha'])
 
 # 2. 相関散布図
@@ -117,7 +117,7 @@ ax1.scatter(cluster3_x, cluster3_y, alpha=0.7, label='Cluster 3', s=50)
 ax1.set_xlabel('X Coordinate')
 ax1.set_ylabel('Y Coordinate')
 ax1.set_title('Cluster Analysis')
-ax1.legend()
+mpl_config.legend(ax1)
 ax1.grid(True, alpha=plt.rcParams['grid.alpha'])
 
 ax2.scatter(x_corr, y_corr, alpha=0.6, s=30, color='red')
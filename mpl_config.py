@@ -4,11 +4,86 @@
 論文・プレゼン用のグラフ設定を簡単に変更
 """
 
-import matplotlib.pyplot as plt
-import matplotlib as mpl
-from matplotlib import _mathtext as mathtext
-from contextlib import contextmanager
-from typing import List
+import atexit
+import functools
+import hashlib
+import io
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import warnings
+import weakref
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from multiprocessing import shared_memory
+from typing import List, NamedTuple, Optional, Union
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# コールドスタート用スナップショット（build_snapshotで作成）。
+# フォントキャッシュを読ませるため、matplotlibのimport前にMPLCONFIGDIRを設定する
+SNAPSHOT_ENV = 'MPL_CONFIG_SNAPSHOT'
+
+
+def _snapshot_config_dir(directory: str) -> str:
+    """
+    スナップショットのフォント一覧を読ませるMPLCONFIGDIRを返す
+
+    matplotlibは書き込めないMPLCONFIGDIRを無視して一時ディレクトリで
+    フォントキャッシュを作り直すため、読み取り専用（非rootで実行する
+    イメージなど）の場合はフォント一覧を書き込める一時ディレクトリにコピーする
+    """
+    config_dir = os.path.join(directory, 'mplconfig')
+    if not os.path.isdir(config_dir) or os.access(config_dir, os.W_OK):
+        return config_dir
+    writable = tempfile.mkdtemp(prefix='mpl_config-')
+    atexit.register(shutil.rmtree, writable, ignore_errors=True)
+    for name in os.listdir(config_dir):
+        if name.startswith('fontlist-'):
+            shutil.copy(os.path.join(config_dir, name), writable)
+    return writable
+
+
+# import時にMPLCONFIGDIRとして設定したディレクトリ（スナップショットの検証用）
+_snapshot_mplconfigdir: Optional[str] = None
+if os.environ.get(SNAPSHOT_ENV) and 'MPLCONFIGDIR' not in os.environ:
+    _snapshot_mplconfigdir = _snapshot_config_dir(os.environ[SNAPSHOT_ENV])
+    os.environ['MPLCONFIGDIR'] = _snapshot_mplconfigdir
+
+import numpy as np  # noqa: E402
+import matplotlib.pyplot as plt  # noqa: E402
+import matplotlib as mpl  # noqa: E402
+from matplotlib import _mathtext as mathtext  # noqa: E402
+from matplotlib import _pylab_helpers  # noqa: E402
+from matplotlib import collections as mcollections  # noqa: E402
+from matplotlib import contour as mcontour  # noqa: E402
+from matplotlib import font_manager  # noqa: E402
+from matplotlib import image as mimage  # noqa: E402
+from matplotlib import legend as mlegend  # noqa: E402
+from matplotlib import offsetbox as moffsetbox  # noqa: E402
+from matplotlib import patches as mpatches  # noqa: E402
+from matplotlib import streamplot as mstreamplot  # noqa: E402
+from matplotlib import text as mtext  # noqa: E402
+from matplotlib import transforms as mtransforms  # noqa: E402
+from matplotlib.backends.backend_agg import FigureCanvasAgg  # noqa: E402
+from matplotlib.collections import LineCollection  # noqa: E402
+from matplotlib.container import ErrorbarContainer  # noqa: E402
+from matplotlib.lines import Line2D  # noqa: E402
+from matplotlib.mathtext import MathTextParser  # noqa: E402
+from PIL import Image, PngImagePlugin  # noqa: E402
+
+
+logger = logging.getLogger(__name__)
 
 
 # プリセット設定
@@ -50,28 +125,251 @@ PRESETS = {
     }
 }
 
-
-def optimize_math_rendering() -> None:
-    """数式表示の改善設定を適用"""
-    # Computer Modern フォント定数を使用
-    mathtext.FontConstantsBase = mathtext.ComputerModernFontConstants
+# 描画プロファイル（サイズプリセットと組み合わせて使用）
+RENDER_PROFILES = {
+    # 下書き・プレビュー用: 間引きを最大にし、アンチエイリアスを切る
+    'draft': {
+        'path.simplify': True,
+        'path.simplify_threshold': 1.0,
+        'agg.path.chunksize': 20000,
+        'text.hinting': 'no_hinting',
+        'lines.antialiased': False,
+        'patch.antialiased': False,
+        'image.interpolation': 'nearest',
+        'pdf.fonttype': 3,
+        'ps.fonttype': 3,
+        'pdf.compression': 1,
+    },
+    
+    # 大量データ向け: 見た目をほぼ保ったまま描画を軽くする
+    'fast': {
+        'path.simplify': True,
+        'path.simplify_threshold': 0.5,
+        'agg.path.chunksize': 10000,
+        'text.hinting': 'default',
+        'lines.antialiased': True,
+        'patch.antialiased': True,
+        'image.interpolation': 'nearest',
+        'pdf.fonttype': 3,
+        'ps.fonttype': 3,
+        'pdf.compression': 6,
+    },
     
+    # 通常の品質（matplotlibのデフォルトに近い）
+    'quality': {
+        'path.simplify': True,
+        'path.simplify_threshold': 1 / 9,
+        'agg.path.chunksize': 0,
+        'text.hinting': 'default',
+        'lines.antialiased': True,
+        'patch.antialiased': True,
+        'image.interpolation': 'antialiased',
+        'pdf.fonttype': 42,
+        'ps.fonttype': 42,
+        'pdf.compression': 6,
+    },
+    
+    # 保存用: 間引きをせず、フォントを埋め込み、画像は元の画素のまま出力
+    'archival': {
+        'path.simplify': False,
+        'path.simplify_threshold': 1 / 9,
+        'agg.path.chunksize': 0,
+        'text.hinting': 'default',
+        'lines.antialiased': True,
+        'patch.antialiased': True,
+        'image.interpolation': 'none',
+        'pdf.fonttype': 42,
+        'ps.fonttype': 42,
+        'pdf.compression': 9,
+    },
+}
+
+# プロファイルが設定するキー（どのプロファイルも同じキーを設定する）
+_PROFILE_KEYS = tuple(RENDER_PROFILES['quality'])
+
+# 数式スペーシング（Computer Modernのフォント定数に対する上書き）
+DEFAULT_MATH_SPACING = {
     # スペーシングの最適化
-    mathtext.FontConstantsBase.script_space = 0.01
-    mathtext.FontConstantsBase.delta = 0.01             # デフォルト: 0.075
+    'script_space': 0.01,
+    'delta': 0.01,                # デフォルト: 0.075
     
     # 上付き文字の位置調整（より自然な位置に）
-    mathtext.FontConstantsBase.sup1 = 0.3               # デフォルト: 0.45
+    'sup1': 0.3,                  # デフォルト: 0.45
     
     # 以下はデフォルト値のまま（必要に応じてコメントアウトを外して調整可能）
-    # mathtext.FontConstantsBase.subdrop = 0.2          # 下付き文字のドロップ量
-    # mathtext.FontConstantsBase.sub1 = 0.2             # 下付き文字位置1
-    # mathtext.FontConstantsBase.sub2 = 0.3             # 下付き文字位置2
-    # mathtext.FontConstantsBase.delta_slanted = 0.3    # 斜体文字のスペース
-    # mathtext.FontConstantsBase.delta_integral = 0.3   # 積分記号のスペース
+    # 'subdrop': 0.2,             # 下付き文字のドロップ量
+    # 'sub1': 0.2,                # 下付き文字位置1
+    # 'sub2': 0.3,                # 下付き文字位置2
+    # 'delta_slanted': 0.3,       # 斜体文字のスペース
+    # 'delta_integral': 0.3,      # 積分記号のスペース
+}
+
+# プリセットごとの数式スペーシング
+MATH_SPACING = {
+    'paper': DEFAULT_MATH_SPACING.copy(),
+    'presentation': DEFAULT_MATH_SPACING.copy(),
+    'presentation_large': DEFAULT_MATH_SPACING.copy(),
+}
+
+# apply_styleで最後に適用したプリセットと設定（style_snapshot()で参照）
+_current_style: Optional[tuple] = None
+
+# 数式スペーシングの既定値（apply_styleで設定）とスコープごとの値
+_default_math_spacing: Optional[tuple] = None
+_math_spacing_var: ContextVar[Optional[tuple]] = ContextVar('mpl_config_math_spacing',
+                                                            default=None)
+
+
+def _active_math_spacing() -> Optional[tuple]:
+    """現在のスコープで有効な数式スペーシング（未設定ならNone）"""
+    spacing = _math_spacing_var.get()
+    return spacing if spacing is not None else _default_math_spacing
+
+
+@functools.lru_cache(maxsize=None)
+def _scoped_font_constants(base: type, spacing: Optional[tuple]) -> type:
+    """
+    フォント定数クラスにスペーシングを適用したサブクラスを返す
+
+    元のクラスは変更しない。汎用の定数はComputer Modernの定数に置き換え、
+    Computer Modern系の定数にだけスペーシングを上書きする
+    """
+    if spacing is None:
+        return base
+    if base is mathtext.FontConstantsBase:
+        base = mathtext.ComputerModernFontConstants
+    if not spacing or not issubclass(base, mathtext.ComputerModernFontConstants):
+        return base
+    return type(f'Scoped{base.__name__}', (base,), dict(spacing))
+
+
+def _wrap_font_constants(method):
+    """get_font_constantsをスコープのスペーシングを反映するようにラップ"""
+    @functools.wraps(method)
+    def get_font_constants(*args):
+        return _scoped_font_constants(method(*args), _active_math_spacing())
+    get_font_constants._mpl_config_scoped = True
+    return get_font_constants
+
+
+def _wrap_parse_cached(parse_cached):
+    """数式の解析キャッシュのキーにスペーシングを含める"""
+    @functools.lru_cache(maxsize=256)
+    def parse_with_spacing(self, spacing, *args):
+        return parse_cached(self, *args)
+
+    @functools.wraps(parse_cached)
+    def _parse_cached(self, *args):
+        return parse_with_spacing(self, _active_math_spacing(), *args)
+    _parse_cached._mpl_config_scoped = True
+    return _parse_cached
+
+
+def _wrap_text_metrics(get_text_metrics):
+    """数式の寸法キャッシュのキーにスペーシングを含める"""
+    caches = weakref.WeakKeyDictionary()
+
+    @functools.wraps(get_text_metrics)
+    def _get_text_metrics_with_cache(renderer, text, fontprop, ismath, dpi):
+        if ismath is not True:
+            return get_text_metrics(renderer, text, fontprop, ismath, dpi)
+        cache = caches.get(renderer)
+        if cache is None:
+            renderer_ref = weakref.ref(renderer)
+
+            @functools.lru_cache(maxsize=4096)
+            def cache(text, fontprop, dpi, spacing):
+                return renderer_ref().get_text_width_height_descent(
+                    text, fontprop, ismath=True)
+            caches[renderer] = cache
+        return cache(text, fontprop.copy(), dpi, _active_math_spacing())
+    _get_text_metrics_with_cache._mpl_config_scoped = True
+    return _get_text_metrics_with_cache
+
+
+def _install_scoped_math_spacing() -> None:
+    """
+    数式スペーシングをスコープごとに切り替えるためのフックを一度だけ登録
+
+    フォント定数クラスは書き換えず、定数の取得・解析キャッシュ・寸法キャッシュが
+    現在のスコープのスペーシングを参照するようにする
+    """
+    fonts_classes = [mathtext.Fonts]
+    for cls in fonts_classes:
+        fonts_classes.extend(cls.__subclasses__())
+        method = cls.__dict__.get('get_font_constants')
+        if method is not None and not getattr(method, '_mpl_config_scoped', False):
+            cls.get_font_constants = _wrap_font_constants(method)
+    # matplotlib 3.8以前はモジュール関数でフォント定数を選ぶ
+    get_constant_set = getattr(mathtext, '_get_font_constant_set', None)
+    if get_constant_set is not None and not getattr(
+            get_constant_set, '_mpl_config_scoped', False):
+        mathtext._get_font_constant_set = _wrap_font_constants(get_constant_set)
+
+    parse_cached = MathTextParser._parse_cached
+    if not getattr(parse_cached, '_mpl_config_scoped', False):
+        MathTextParser._parse_cached = _wrap_parse_cached(
+            getattr(parse_cached, '__wrapped__', parse_cached))
+
+    get_text_metrics = mtext._get_text_metrics_with_cache
+    if not getattr(get_text_metrics, '_mpl_config_scoped', False):
+        mtext._get_text_metrics_with_cache = _wrap_text_metrics(get_text_metrics)
+
+
+def _math_spacing_for(preset_name: Optional[str] = None, **constants) -> tuple:
+    """プリセットのスペーシングに個別の値を重ねたハッシュ可能なタプル"""
+    spacing = dict(MATH_SPACING.get(preset_name, DEFAULT_MATH_SPACING))
+    spacing.update(constants)
+    return tuple(sorted(spacing.items()))
+
+
+def optimize_math_rendering(preset_name: Optional[str] = None) -> None:
+    """
+    数式表示の改善設定を適用
+
+    フォント定数のクラス属性は書き換えず、以後の数式描画で使う
+    スペーシングの既定値を設定する
+
+    Parameters:
+    -----------
+    preset_name : str, optional
+        MATH_SPACINGから使うプリセット（省略時はDEFAULT_MATH_SPACING）
+    """
+    global _default_math_spacing
+    _install_scoped_math_spacing()
+    _default_math_spacing = _math_spacing_for(preset_name)
+
+
+@contextmanager
+def math_spacing(preset_name: Optional[str] = None, **constants):
+    """
+    数式スペーシングをスコープ内だけで切り替えるコンテキストマネージャー
 
+    コンテキスト変数を使うため、スレッドごとに異なるスペーシングで
+    同時に描画しても互いに影響しない。解析結果はスペーシングごとにキャッシュされる
 
-def apply_style(preset_name: str = 'presentation', **kwargs) -> None:
+    Parameters:
+    -----------
+    preset_name : str, optional
+        MATH_SPACINGから使うプリセット
+    **constants : dict
+        個別に上書きするフォント定数（script_space, delta, sup1 など）
+
+    Example:
+    --------
+    with math_spacing('paper', sup1=0.35):
+        fig.savefig('equation.png')
+    """
+    _install_scoped_math_spacing()
+    token = _math_spacing_var.set(_math_spacing_for(preset_name, **constants))
+    try:
+        yield
+    finally:
+        _math_spacing_var.reset(token)
+
+
+def apply_style(preset_name: str = 'presentation', profile: Optional[str] = None,
+                **kwargs) -> None:
     """
     スタイルプリセットを適用
     
@@ -79,25 +377,49 @@ def apply_style(preset_name: str = 'presentation', **kwargs) -> None:
     -----------
     preset_name : str
         'paper', 'presentation', 'presentation_large'のいずれか
+    profile : str, optional
+        描画プロファイル（'draft', 'fast', 'quality', 'archival'のいずれか）
     **kwargs : dict
         追加のカスタマイズ設定
     """
     if preset_name not in PRESETS:
         available = ', '.join(PRESETS.keys())
         raise ValueError(f"不明なプリセット: {preset_name}. 利用可能: {available}")
+    if profile is not None and profile not in RENDER_PROFILES:
+        available = ', '.join(RENDER_PROFILES.keys())
+        raise ValueError(f"不明なプロファイル: {profile}. 利用可能: {available}")
     
     # プリセット設定を適用
-    settings = PRESETS[preset_name].copy()
-    settings.update(kwargs)
+    settings = _style_settings(preset_name, profile, **kwargs)
     
     for key, value in settings.items():
         plt.rcParams[key] = value
     
+    global _current_style
+    _current_style = (preset_name, _freeze_settings(settings))
+    
     # 共通設定
     _apply_common_settings()
     
     # 数式表示の最適化
-    optimize_math_rendering()
+    optimize_math_rendering(preset_name)
+
+
+def _style_settings(preset_name: str, profile: Optional[str] = None, **kwargs) -> dict:
+    """
+    apply_styleで設定するrcParamsを求める
+
+    プロファイルを指定しない場合、プロファイルのキーはmatplotlibのデフォルトに
+    戻す（前に適用したプロファイルの設定が残ると、style_snapshotが同じでも
+    描画結果が変わるため）
+    """
+    if profile is None:
+        settings = {key: mpl.rcParamsDefault[key] for key in _PROFILE_KEYS}
+    else:
+        settings = dict(RENDER_PROFILES[profile])
+    settings.update(PRESETS[preset_name])
+    settings.update(kwargs)
+    return settings
 
 
 def _apply_common_settings() -> None:
@@ -146,6 +468,28 @@ def set_figsize(width: float, height: float) -> None:
         図の高さ（インチ）
     """
     plt.rcParams['figure.figsize'] = [width, height]
+    
+    global _current_style
+    if _current_style is not None:
+        preset_name, settings = _current_style
+        settings = dict(settings)
+        settings['figure.figsize'] = repr([width, height])
+        _current_style = (preset_name, tuple(sorted(settings.items())))
+
+
+def _freeze_settings(settings: dict) -> tuple:
+    """設定の辞書をハッシュ可能なタプルに変換"""
+    return tuple(sorted((key, repr(value)) for key, value in settings.items()))
+
+
+def style_snapshot() -> Optional[tuple]:
+    """
+    apply_styleで適用中のプリセットと設定のスナップショットを返す
+
+    (プリセット名, ((キー, 値のrepr), ...)) のハッシュ可能なタプル。
+    apply_styleを一度も呼んでいない、またはreset()後はNone
+    """
+    return _current_style
 
 
 @contextmanager
@@ -159,12 +503,19 @@ def temp_style(preset_name: str, **kwargs):
         plt.plot(x, y)
         plt.show()
     """
+    global _current_style, _default_math_spacing
     original = plt.rcParams.copy()
+    original_style = _current_style
+    original_math_spacing = _default_math_spacing
+    token = _math_spacing_var.set(_math_spacing_for(preset_name))
     try:
         apply_style(preset_name, **kwargs)
         yield
     finally:
         plt.rcParams.update(original)
+        _current_style = original_style
+        _default_math_spacing = original_math_spacing
+        _math_spacing_var.reset(token)
 
 
 def list_presets() -> List[str]:
@@ -172,9 +523,17 @@ def list_presets() -> List[str]:
     return list(PRESETS.keys())
 
 
+def list_profiles() -> List[str]:
+    """利用可能な描画プロファイル一覧を返す"""
+    return list(RENDER_PROFILES.keys())
+
+
 def reset() -> None:
     """デフォルト設定に戻す"""
+    global _current_style, _default_math_spacing
     mpl.rcdefaults()
+    _current_style = None
+    _default_math_spacing = None
 
 
 def enable_math_optimization() -> None:
@@ -182,12 +541,3021 @@ def enable_math_optimization() -> None:
     optimize_math_rendering()
 
 
-# モジュールimport時に自動的にpresentationスタイルを適用
-apply_style('presentation')
+# 図のメモリ管理
+_FIGURE_HOOK = f'{__name__}:_track_new_figure'
+_active_trackers: List['FigureTracker'] = []
 
 
-# 使用例
-if __name__ == "__main__":
+def _track_new_figure(fig) -> None:
+    """figure.hooksから呼ばれ、アクティブなトラッカーに新しい図を登録"""
+    for tracker in _active_trackers:
+        tracker._register(fig)
+
+
+def estimate_figure_memory(fig) -> int:
+    """
+    図のAggバッファのメモリ量を推定（バイト）
+
+    キャンバスサイズ（インチ）× dpi のRGBAバッファとして計算する
+    """
+    width, height = fig.get_size_inches() * fig.dpi
+    return int(round(width)) * int(round(height)) * 4
+
+
+def _open_figure_ids() -> set:
+    """pyplotで開いている図のidの集合"""
+    return {id(manager.canvas.figure)
+            for manager in _pylab_helpers.Gcf.get_all_fig_managers()}
+
+
+def _current_rss() -> Optional[int]:
+    """プロセスの現在のRSSを返す（バイト、/procのない環境ではNone）"""
+    try:
+        with open('/proc/self/statm') as f:
+            resident_pages = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return resident_pages * os.sysconf('SC_PAGE_SIZE')
+
+
+def _max_rss() -> Optional[int]:
+    """プロセス開始以来の最大RSSを返す（バイト、resourceのない環境ではNone）"""
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOSはバイト、Linuxなどはキロバイト単位
+    return max_rss if sys.platform == 'darwin' else max_rss * 1024
+
+
+class FigureTracker:
+    """
+    スコープ内で作成された図を追跡するクラス
+
+    figure_scope() から返され、図の一覧・推定メモリ・上限チェックを提供する。
+    図は弱参照で保持するため、閉じた図はスコープ内でも解放される。
+    peak_rssはスコープ内の最大RSS、rss_deltaは開始時のRSSからの増加量。
+    savefig中などの一時的なピークはプロセスの最大RSS（ru_maxrss）が
+    スコープ内で更新されたかどうかで捉える。スコープ開始前にそれ以上の
+    ピークがあった場合は、開始時・図の登録時・check()・終了時に測った
+    現在値の最大値になる（実際のピークの下限）
+    """
+
+    def __init__(self, warn_threshold: Optional[int] = None,
+                 max_figures: Optional[int] = None):
+        self.warn_threshold = warn_threshold
+        self.max_figures = max_figures
+        self._figures: List['weakref.ref'] = []
+        self._warned = False
+        self.start_rss: Optional[int] = _current_rss()
+        self.peak_rss: Optional[int] = self.start_rss
+        self._start_max_rss = _max_rss()
+
+    def _sample_rss(self) -> None:
+        """現在のRSSとプロセスの最大RSSでピークを更新"""
+        samples = [_current_rss()]
+        max_rss = _max_rss()
+        # プロセスの最大RSSがスコープ内で更新されていれば、そのピークはスコープ内
+        if (max_rss is not None and self._start_max_rss is not None
+                and max_rss > self._start_max_rss):
+            samples.append(max_rss)
+        for rss in samples:
+            if rss is not None and (self.peak_rss is None or rss > self.peak_rss):
+                self.peak_rss = rss
+
+    def _register(self, fig) -> None:
+        if any(fig is ref() for ref in self._figures):
+            return
+        self._figures.append(weakref.ref(fig))
+        # フック呼び出し時点では新しい図はまだpyplotに登録されていない
+        self.check(pending=fig)
+
+    def _prune(self, open_ids: set, pending=None) -> None:
+        """解放済み・閉じた図の参照を削除"""
+        self._figures = [ref for ref in self._figures
+                         if ref() is not None
+                         and (id(ref()) in open_ids or ref() is pending)]
+
+    @property
+    def figures(self) -> List:
+        """スコープ内で作成され、まだ開いている図"""
+        open_ids = _open_figure_ids()
+        return [fig for fig in (ref() for ref in self._figures)
+                if fig is not None and id(fig) in open_ids]
+
+    def memory_bytes(self) -> int:
+        """開いている図の推定メモリ合計（バイト）"""
+        return sum(estimate_figure_memory(fig) for fig in self.figures)
+
+    def check(self, pending=None) -> None:
+        """開いている図の数をポリシーと照合"""
+        self._sample_rss()
+        self._prune(_open_figure_ids(), pending)
+        figures = self.figures
+        if pending is not None and not any(pending is f for f in figures):
+            figures.append(pending)
+        n_open = len(figures)
+        if self.max_figures is not None and n_open > self.max_figures:
+            raise RuntimeError(
+                f"開いている図が上限を超えました: {n_open} > {self.max_figures}")
+        if (self.warn_threshold is not None and n_open > self.warn_threshold
+                and not self._warned):
+            self._warned = True
+            warnings.warn(
+                f"開いている図が{self.warn_threshold}枚を超えました "
+                f"({n_open}枚, 推定"
+                f"{sum(map(estimate_figure_memory, figures)) / 2**20:.1f} MiB)",
+                RuntimeWarning, stacklevel=3)
+
+    def close_all(self) -> None:
+        """スコープ内で作成された図をすべて閉じる"""
+        for fig in self.figures:
+            plt.close(fig)
+
+    def report(self) -> dict:
+        """図の枚数・推定メモリ・スコープ内のピークRSSとその増加量をまとめて返す"""
+        self._sample_rss()
+        return {
+            'open_figures': len(self.figures),
+            'memory_bytes': self.memory_bytes(),
+            'peak_rss': self.peak_rss,
+            'rss_delta': (self.peak_rss - self.start_rss
+                          if self.peak_rss is not None and self.start_rss is not None
+                          else None),
+        }
+
+
+@contextmanager
+def figure_scope(preset_name: Optional[str] = None,
+                 auto_close: bool = True,
+                 warn_threshold: Optional[int] = None,
+                 max_figures: Optional[int] = None,
+                 **kwargs):
+    """
+    スコープ内で作成された図を追跡するコンテキストマネージャー
+
+    Parameters:
+    -----------
+    preset_name : str, optional
+        指定した場合はスコープ内でtemp_styleと同様にプリセットを適用
+    auto_close : bool
+        スコープ終了時に作成された図を閉じる
+    warn_threshold : int, optional
+        開いている図がこの枚数を超えたらRuntimeWarningを出す
+    max_figures : int, optional
+        開いている図がこの枚数を超えたらRuntimeErrorを送出
+    **kwargs : dict
+        temp_styleに渡す追加のカスタマイズ設定
+
+    Example:
+    --------
+    with figure_scope('paper', warn_threshold=20) as tracker:
+        fig, ax = plt.subplots()
+        ...
+        print(tracker.report())
+    """
+    tracker = FigureTracker(warn_threshold=warn_threshold,
+                            max_figures=max_figures)
+    hooks_supported = 'figure.hooks' in mpl.rcParams
+    style = (temp_style(preset_name, **kwargs) if preset_name is not None
+             else nullcontext())
+    with style:
+        original_hooks = list(plt.rcParams['figure.hooks']) if hooks_supported else None
+        if hooks_supported and _FIGURE_HOOK not in original_hooks:
+            plt.rcParams['figure.hooks'] = original_hooks + [_FIGURE_HOOK]
+        before = _open_figure_ids()
+        _active_trackers.append(tracker)
+        try:
+            yield tracker
+        finally:
+            _active_trackers.remove(tracker)
+            if hooks_supported:
+                plt.rcParams['figure.hooks'] = original_hooks
+            # figure.hooksが使えない環境向けに番号の差分でも補足
+            for manager in _pylab_helpers.Gcf.get_all_fig_managers():
+                fig = manager.canvas.figure
+                if id(fig) not in before and not any(
+                        fig is ref() for ref in tracker._figures):
+                    tracker._figures.append(weakref.ref(fig))
+            report = tracker.report()
+            logger.info(
+                "figure_scope: 図%d枚, 推定%.1f MiB, ピークRSS %s (開始時から%s)",
+                report['open_figures'], report['memory_bytes'] / 2**20,
+                (f"{report['peak_rss'] / 2**20:.1f} MiB"
+                 if report['peak_rss'] is not None else "不明"),
+                (f"{report['rss_delta'] / 2**20:+.1f} MiB"
+                 if report['rss_delta'] is not None else "不明"))
+            if auto_close:
+                tracker.close_all()
+
+
+# 並列描画用の共有メモリ
+SHARE_THRESHOLD_BYTES = 1 << 20  # これ以上の配列は自動的に共有メモリ経由で渡す
+_attached_arrays: List['SharedArray'] = []
+
+
+def _release_shared_memory(shm, unlink: bool) -> None:
+    """共有メモリを閉じ、所有者であれば削除する"""
+    try:
+        shm.close()
+    except BufferError:
+        # ビューが残っている場合でもunlinkは実行する
+        pass
+    if unlink:
+        try:
+            shm.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def _attach_shared_array(name: str, shape: tuple, dtype: str) -> 'SharedArray':
+    """pickle復元時に呼ばれ、既存の共有メモリにアタッチする"""
+    shared = SharedArray.__new__(SharedArray)
+    shared._setup(shared_memory.SharedMemory(name=name), shape, dtype, owner=False)
+    _attached_arrays.append(shared)
+    return shared
+
+
+class SharedArray:
+    """
+    共有メモリ上のNumPy配列
+
+    ワーカープロセスへはセグメント名・形状・dtypeだけがpickleされ、
+    受け取った側はコピーせずに同じメモリをNumPy配列として参照する。
+    作成したプロセスが所有者となり、close()・with文の終了・GC・
+    インタプリタ終了のいずれかで共有メモリを削除する。
+    ワーカーがクラッシュしても所有者側で削除されるため、セグメントは残らない。
+
+    Example:
+    --------
+    with SharedArray(Z) as shared:
+        results = parallel_render(render_frame, [(shared, i) for i in range(10)])
+    """
+
+    def __init__(self, array):
+        array = np.ascontiguousarray(array)
+        shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        self._setup(shm, array.shape, array.dtype.str, owner=True)
+        self.array[...] = array
+
+    def _setup(self, shm, shape: tuple, dtype: str, owner: bool) -> None:
+        self._shm = shm
+        self.name = shm.name
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.owner = owner
+        self.array = np.ndarray(self.shape, dtype=self.dtype, buffer=shm.buf)
+        self._finalizer = weakref.finalize(self, _release_shared_memory, shm, owner)
+
+    def __reduce__(self):
+        return _attach_shared_array, (self.name, self.shape, self.dtype.str)
+
+    def __array__(self, dtype=None, copy=None):
+        return self.array if dtype is None else self.array.astype(dtype)
+
+    def close(self) -> None:
+        """配列ビューを解放し、所有者であれば共有メモリを削除する"""
+        self.array = None
+        self._finalizer()
+
+    @property
+    def closed(self) -> bool:
+        return not self._finalizer.alive
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _share_arrays(args: tuple, shared: dict) -> tuple:
+    """大きなndarray引数をSharedArrayに置き換える（同じ配列は1度だけ共有）"""
+    converted = []
+    for arg in args:
+        if isinstance(arg, np.ndarray) and arg.nbytes >= SHARE_THRESHOLD_BYTES:
+            if id(arg) not in shared:
+                shared[id(arg)] = (arg, SharedArray(arg))
+            arg = shared[id(arg)][1]
+        converted.append(arg)
+    return tuple(converted)
+
+
+def _init_render_worker(preset_name: Optional[str], style_kwargs: dict) -> None:
+    """ワーカープロセスの初期化（Aggバックエンドとプリセットの適用）"""
+    plt.switch_backend('Agg')
+    if preset_name is not None:
+        apply_style(preset_name, **style_kwargs)
+
+
+def _run_render_task(render_func, args: tuple):
+    """ワーカー内で1タスクを実行し、アタッチした共有メモリを解放する"""
+    resolved = [arg.array if isinstance(arg, SharedArray) else arg
+                for arg in args]
+    try:
+        result = render_func(*resolved)
+        if isinstance(result, mpl.figure.Figure):
+            buffer = io.BytesIO()
+            result.savefig(buffer, format='png')
+            plt.close(result)
+            result = buffer.getvalue()
+        return result
+    finally:
+        del resolved
+        while _attached_arrays:
+            _attached_arrays.pop().close()
+
+
+def parallel_render(render_func, tasks, preset_name: Optional[str] = None,
+                    max_workers: Optional[int] = None, **kwargs) -> list:
+    """
+    描画関数を複数プロセスで並列実行
+
+    タスク引数に含まれる大きなndarrayは自動的に共有メモリへ置かれ、
+    ワーカーにはpickleによるコピーなしで渡される。
+    共有メモリは全タスクの終了後（ワーカーがクラッシュした場合も含む）に削除される。
+
+    Parameters:
+    -----------
+    render_func : callable
+        モジュールのトップレベルに定義された関数。Figureを返した場合はPNGバイト列に変換
+    tasks : iterable
+        各タスクの引数タプル（タプル以外は単一引数として扱う）
+    preset_name : str, optional
+        ワーカーで適用するプリセット
+    max_workers : int, optional
+        ワーカープロセス数（省略時はCPU数）
+    **kwargs : dict
+        プリセットに追加するカスタマイズ設定
+
+    Returns:
+    --------
+    list
+        タスクと同じ順序の描画結果
+    """
+    shared = {}
+    try:
+        task_args = [_share_arrays(task if isinstance(task, tuple) else (task,),
+                                   shared)
+                     for task in tasks]
+        with ProcessPoolExecutor(max_workers=max_workers,
+                                 initializer=_init_render_worker,
+                                 initargs=(preset_name, kwargs)) as executor:
+            futures = [executor.submit(_run_render_task, render_func, args)
+                       for args in task_args]
+            return [future.result() for future in futures]
+    finally:
+        for _, shared_array in shared.values():
+            shared_array.close()
+
+
+# 大規模データ用プロット
+DEFAULT_CHUNK_SIZE = 1_000_000  # 1チャンクあたりの要素数
+
+
+def _load_array(source):
+    """ファイルパスならメモリマップで開き、配列ならそのまま返す"""
+    if isinstance(source, (str, os.PathLike)):
+        return np.load(source, mmap_mode='r')
+    return source
+
+
+def _output_dpi() -> float:
+    """保存時のdpi（savefig.dpiが'figure'の場合はfigure.dpi）"""
+    dpi = plt.rcParams['savefig.dpi']
+    return plt.rcParams['figure.dpi'] if dpi == 'figure' else dpi
+
+
+def _target_resolution(ax=None) -> tuple:
+    """
+    描画先のピクセル数 (幅, 高さ) を返す
+
+    プリセットの図のサイズと保存時のdpiから計算し、
+    axを指定した場合は図の中でaxesが占める割合を掛ける
+    """
+    dpi = _output_dpi()
+    if ax is None:
+        width, height = plt.rcParams['figure.figsize']
+        return max(int(width * dpi), 1), max(int(height * dpi), 1)
+    fig_width, fig_height = ax.figure.get_size_inches()
+    position = ax.get_position()
+    return (max(int(fig_width * position.width * dpi), 1),
+            max(int(fig_height * position.height * dpi), 1))
+
+
+def _iter_chunks(n: int, chunk_size: int):
+    """0からnまでをchunk_size刻みのスライスで返す"""
+    for start in range(0, n, chunk_size):
+        yield slice(start, min(start + chunk_size, n))
+
+
+def _chunked_range(array, chunk_size: int) -> tuple:
+    """チャンクごとに走査してNaNを除いた最小値・最大値を求める"""
+    lo, hi = np.inf, -np.inf
+    for chunk in _iter_chunks(len(array), chunk_size):
+        values = np.asarray(array[chunk], dtype=float)
+        values = values[np.isfinite(values)]
+        if values.size:
+            lo, hi = min(lo, values.min()), max(hi, values.max())
+    if lo > hi:
+        raise ValueError("有限な値がありません")
+    return lo, hi
+
+
+def _block_reduce(array, fy: int, fx: int):
+    """
+    2次元配列をfy×fxのブロックごとに平均（NaNは無視）
+
+    端で割り切れないブロックは残りの要素だけで平均する
+    """
+    values = np.asarray(array, dtype=float)
+    valid = np.isfinite(values)
+    rows = np.arange(0, values.shape[0], fy)
+    cols = np.arange(0, values.shape[1], fx)
+    sums = np.add.reduceat(np.add.reduceat(np.where(valid, values, 0.0),
+                                           rows, axis=0), cols, axis=1)
+    counts = np.add.reduceat(np.add.reduceat(valid.astype(np.int64),
+                                             rows, axis=0), cols, axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(counts > 0, sums / counts, np.nan)
+
+
+def _accumulate_column_minmax(y_low, y_high, x, y, x_min: float,
+                              scale: float) -> None:
+    """各点をピクセル列に割り当て、列ごとの最小・最大値を更新"""
+    valid = np.isfinite(x) & np.isfinite(y)
+    columns = ((x[valid] - x_min) * scale).astype(np.int64)
+    np.clip(columns, 0, len(y_low) - 1, out=columns)
+    np.minimum.at(y_low, columns, y[valid])
+    np.maximum.at(y_high, columns, y[valid])
+
+
+def _column_minmax_vertices(y_low, y_high, x_min: float, scale: float) -> tuple:
+    """列ごとの最小・最大値を上下に往復する折れ線の頂点に変換"""
+    n_cols = len(y_low)
+    filled = y_low <= y_high
+    centers = x_min + (np.arange(n_cols) + 0.5) / scale if scale else np.full(n_cols, x_min)
+    return (np.repeat(centers[filled], 2),
+            np.column_stack([y_low[filled], y_high[filled]]).ravel())
+
+
+def plot_large_line(ax, y, x=None, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                    **kwargs):
+    """
+    巨大な1次元データを列ごとの最小・最大値に間引いて折れ線を描画
+
+    データはチャンク単位で読み込むため、メモリ使用量は入力サイズではなく
+    描画先のピクセル幅（プリセットの図のサイズ×dpi）で決まる
+
+    Parameters:
+    -----------
+    ax : matplotlib.axes.Axes
+        描画先のAxes
+    y : array-like, np.memmap or path
+        y座標（.npyファイルのパスも可）
+    x : array-like, np.memmap or path, optional
+        x座標（省略時はインデックス）
+    chunk_size : int
+        1回に読み込む要素数
+    **kwargs : dict
+        ax.plotに渡す追加引数
+
+    Returns:
+    --------
+    list of Line2D
+    """
+    y = _load_array(y)
+    x = _load_array(x) if x is not None else None
+    n = len(y)
+    if x is not None and len(x) != n:
+        raise ValueError(f"xとyの長さが一致しません: {len(x)} != {n}")
+    n_cols = _target_resolution(ax)[0]
+
+    x_min, x_max = (0.0, float(n - 1)) if x is None else _chunked_range(x, chunk_size)
+    scale = n_cols / (x_max - x_min) if x_max > x_min else 0.0
+
+    y_low = np.full(n_cols, np.inf)
+    y_high = np.full(n_cols, -np.inf)
+    for chunk in _iter_chunks(n, chunk_size):
+        y_chunk = np.asarray(y[chunk], dtype=float)
+        x_chunk = (np.arange(chunk.start, chunk.stop, dtype=float) if x is None
+                   else np.asarray(x[chunk], dtype=float))
+        _accumulate_column_minmax(y_low, y_high, x_chunk, y_chunk, x_min, scale)
+
+    return ax.plot(*_column_minmax_vertices(y_low, y_high, x_min, scale), **kwargs)
+
+
+def scatter_density(ax, x, y, bins=None, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                    norm='log', **kwargs):
+    """
+    巨大な散布図データを2次元ヒストグラムに集計して描画
+
+    Parameters:
+    -----------
+    ax : matplotlib.axes.Axes
+        描画先のAxes
+    x, y : array-like, np.memmap or path
+        座標（.npyファイルのパスも可）
+    bins : int or (int, int), optional
+        ビン数（省略時はaxesのピクセル数）
+    chunk_size : int
+        1回に読み込む要素数
+    norm : str or Normalize
+        カラースケール（デフォルトは対数）
+    **kwargs : dict
+        ax.imshowに渡す追加引数
+
+    Returns:
+    --------
+    AxesImage
+    """
+    x = _load_array(x)
+    y = _load_array(y)
+    if len(x) != len(y):
+        raise ValueError(f"xとyの長さが一致しません: {len(x)} != {len(y)}")
+    if bins is None:
+        bins = _target_resolution(ax)
+    elif np.ndim(bins) == 0:
+        bins = (bins, bins)
+
+    x_range = _chunked_range(x, chunk_size)
+    y_range = _chunked_range(y, chunk_size)
+    counts = np.zeros(bins, dtype=np.int64)
+    for chunk in _iter_chunks(len(x), chunk_size):
+        hist, _, _ = np.histogram2d(np.asarray(x[chunk], dtype=float),
+                                    np.asarray(y[chunk], dtype=float),
+                                    bins=bins, range=[x_range, y_range])
+        counts += hist.astype(np.int64)
+
+    kwargs.setdefault('cmap', 'viridis')
+    kwargs.setdefault('aspect', 'auto')
+    kwargs.setdefault('interpolation', 'nearest')
+    return ax.imshow(np.ma.masked_equal(counts.T, 0), origin='lower',
+                     extent=(*x_range, *y_range), norm=norm, **kwargs)
+
+
+def imshow_large(ax, data, chunk_size: int = DEFAULT_CHUNK_SIZE, **kwargs):
+    """
+    巨大な2次元配列をブロック平均で縮小してから描画
+
+    縮小率はaxesのピクセル数（プリセットの図のサイズ×dpi）から決め、
+    行方向にチャンクを読み込みながら縮小する
+
+    Parameters:
+    -----------
+    ax : matplotlib.axes.Axes
+        描画先のAxes
+    data : array-like, np.memmap or path
+        2次元配列（.npyファイルのパスも可）
+    chunk_size : int
+        1回に読み込むおおよその要素数
+    **kwargs : dict
+        ax.imshowに渡す追加引数
+
+    Returns:
+    --------
+    AxesImage
+    """
+    data = _load_array(data)
+    n_rows, n_cols = data.shape[:2]
+    width, height = _target_resolution(ax)
+    fy = max(-(-n_rows // height), 1)
+    fx = max(-(-n_cols // width), 1)
+
+    # チャンクの行数はブロックの行数の倍数にそろえる
+    rows_per_chunk = max(chunk_size // max(n_cols, 1) // fy, 1) * fy
+    reduced = np.vstack([_block_reduce(data[chunk], fy, fx)
+                         for chunk in _iter_chunks(n_rows, rows_per_chunk)])
+
+    if 'extent' not in kwargs:
+        origin = kwargs.get('origin', plt.rcParams['image.origin'])
+        if origin == 'lower':
+            kwargs['extent'] = (-0.5, n_cols - 0.5, -0.5, n_rows - 0.5)
+        else:
+            kwargs['extent'] = (-0.5, n_cols - 0.5, n_rows - 0.5, -0.5)
+    return ax.imshow(reduced, **kwargs)
+
+
+# ライブプロット（ブリッティング）
+class LivePlot:
+    """
+    ブリッティングによるリアルタイム描画
+
+    軸・目盛・スパインなどの静的な背景をバッファとしてキャッシュし、
+    更新時はリングバッファ内の最新サンプルで線だけを描き直す。
+    背景の再描画はデータが軸の範囲をはみ出したときだけ行う。
+
+    Parameters:
+    -----------
+    ax : matplotlib.axes.Axes, optional
+        描画先のAxes（省略時は新しい図を作成）
+    n_lines : int, optional
+        系列数（省略時はlabelsの数、labelsもなければ1）
+    capacity : int
+        リングバッファに保持するサンプル数
+    labels : list of str, optional
+        各系列のラベル（n_linesと同じ数）
+    margin : float
+        範囲を広げるときに確保する余白（表示幅に対する割合）
+
+    Example:
+    --------
+    live = LivePlot(n_lines=2, capacity=500)
+    plt.show(block=False)
+    while True:
+        live.append(time.time(), read_sensors())
+        live.update()
+    """
+
+    def __init__(self, ax=None, n_lines: Optional[int] = None, capacity: int = 1000,
+                 labels: Optional[List[str]] = None, margin: float = 0.1):
+        if n_lines is None:
+            n_lines = len(labels) if labels is not None else 1
+        if labels is not None and len(labels) != n_lines:
+            raise ValueError(
+                f"labelsの数が系列数と一致しません: {len(labels)} != {n_lines}")
+        if ax is None:
+            _, ax = plt.subplots()
+        self.ax = ax
+        self.canvas = ax.figure.canvas
+        self.capacity = capacity
+        self.margin = margin
+        self._x = np.empty(capacity)
+        self._y = np.empty((n_lines, capacity))
+        self._head = 0
+        self._count = 0
+        labels = labels if labels is not None else [None] * n_lines
+        self.lines = [ax.plot([], [], animated=True, label=label)[0]
+                      for label in labels]
+        self._background = None
+        self._last_update = None
+        self.fps = 0.0
+        self.n_background_draws = 0
+        self.canvas.mpl_connect('draw_event', self._on_draw)
+
+    def _on_draw(self, event) -> None:
+        """全体描画の直後に背景をキャッシュし、線を重ねる"""
+        self._background = self.canvas.copy_from_bbox(self.ax.bbox)
+        self.n_background_draws += 1
+        for line in self.lines:
+            self.ax.draw_artist(line)
+
+    def append(self, x, y) -> None:
+        """
+        サンプルを追加
+
+        Parameters:
+        -----------
+        x : float or array-like
+            時刻などのx座標（k個）
+        y : array-like
+            形状 (n_lines,) または (n_lines, k) の値
+        """
+        x = np.atleast_1d(np.asarray(x, dtype=float))
+        y = np.asarray(y, dtype=float).reshape(len(self.lines), -1)
+        if len(x) > self.capacity:
+            x, y = x[-self.capacity:], y[:, -self.capacity:]
+        index = (self._head + np.arange(len(x))) % self.capacity
+        self._x[index] = x
+        self._y[:, index] = y
+        self._head = (self._head + len(x)) % self.capacity
+        self._count = min(self._count + len(x), self.capacity)
+
+    def data(self) -> tuple:
+        """時系列順に並べたバッファの内容 (x, y) を返す"""
+        if self._count < self.capacity:
+            return self._x[:self._count], self._y[:, :self._count]
+        order = np.r_[self._head:self.capacity, 0:self._head]
+        return self._x[order], self._y[:, order]
+
+    def _limits_changed(self, x, y) -> bool:
+        """データが表示範囲をはみ出した場合に範囲を広げる"""
+        if len(x) == 0:
+            return False
+        changed = False
+        x_low, x_high = self.ax.get_xlim()
+        if x.min() < x_low or x.max() > x_high:
+            span = x.max() - x.min()
+            if 1 < len(x) < self.capacity:
+                # バッファが埋まるまでは平均間隔から最終的な表示幅を見積もる
+                span *= (self.capacity - 1) / (len(x) - 1)
+            span = max(span, np.finfo(float).eps)
+            self.ax.set_xlim(x.min(), x.max() + self.margin * span)
+            changed = True
+        finite = y[np.isfinite(y)]
+        if finite.size:
+            y_low, y_high = self.ax.get_ylim()
+            if finite.min() < y_low or finite.max() > y_high:
+                span = max(finite.max() - finite.min(), np.finfo(float).eps)
+                self.ax.set_ylim(finite.min() - self.margin * span,
+                                 finite.max() + self.margin * span)
+                changed = True
+        return changed
+
+    def update(self) -> None:
+        """線を更新して画面に反映"""
+        x, y = self.data()
+        for line, values in zip(self.lines, y):
+            line.set_data(x, values)
+
+        if self._background is None or self._limits_changed(x, y):
+            # 背景ごと描き直す（draw_eventで背景が再キャッシュされる）
+            self.canvas.draw()
+        else:
+            self.canvas.restore_region(self._background)
+            for line in self.lines:
+                self.ax.draw_artist(line)
+            self.canvas.blit(self.ax.bbox)
+        self.canvas.flush_events()
+
+        now = time.perf_counter()
+        if self._last_update is not None:
+            # 更新間隔の指数移動平均からfpsを推定
+            instant = 1.0 / max(now - self._last_update, 1e-9)
+            self.fps = instant if self.fps == 0.0 else 0.9 * self.fps + 0.1 * instant
+        self._last_update = now
+
+
+# アニメーションの並列書き出し
+def _render_frame(frame_func, frame, encode_png: bool, *args):
+    """ワーカー内で1フレームを描画し、RGBA配列またはPNGバイト列を返す"""
+    fig = frame_func(frame, *args)
+    try:
+        fig.canvas.draw()
+        rgba = np.asarray(fig.canvas.buffer_rgba())
+        if encode_png:
+            buffer = io.BytesIO()
+            Image.fromarray(rgba).save(buffer, format='png')
+            return buffer.getvalue()
+        return rgba.copy()
+    finally:
+        plt.close(fig)
+
+
+def _frame_image(rgba, flatten: bool) -> 'Image.Image':
+    """RGBA配列をPillowの画像に変換（GIF用には白背景に合成）"""
+    image = Image.fromarray(rgba, mode='RGBA')
+    if flatten:
+        background = Image.new('RGBA', image.size, (255, 255, 255, 255))
+        image = Image.alpha_composite(background, image).convert('RGB')
+    return image
+
+
+def export_animation(frame_func, frames, path, preset_name: Optional[str] = None,
+                     fps: float = 10, args: tuple = (),
+                     max_workers: Optional[int] = None,
+                     max_in_flight: Optional[int] = None, **kwargs) -> dict:
+    """
+    アニメーションのフレームを複数プロセスで並列に描画して書き出す
+
+    フレームはワーカーで描画され、順番どおりに書き出し側へ渡される。
+    同時に処理中のフレーム数はmax_in_flightで制限される。
+
+    Parameters:
+    -----------
+    frame_func : callable
+        frame_func(frame, *args) -> Figure。モジュールのトップレベルに定義すること
+    frames : int or iterable
+        フレーム数、またはframe_funcに渡すフレームの値の列
+    path : str
+        出力先。'.gif'ならGIF、'.png'/'.apng'ならAPNG、
+        'frame_{:04d}.png'のように'{}'を含む場合はPNG連番
+    preset_name : str, optional
+        ワーカーで適用するプリセット
+    fps : float
+        再生時のフレームレート（GIF/APNG）
+    args : tuple
+        全フレーム共通の引数。大きなndarrayは共有メモリ経由で渡される
+    max_workers : int, optional
+        ワーカープロセス数（省略時はCPU数）
+    max_in_flight : int, optional
+        同時に処理中のフレーム数の上限（省略時はワーカー数の2倍）
+    **kwargs : dict
+        プリセットに追加するカスタマイズ設定
+
+    Returns:
+    --------
+    dict
+        'frames'（フレーム数）, 'seconds'（所要時間）, 'fps'（描画速度）
+
+    Example:
+    --------
+    def frame(i, Z):
+        fig, ax = plt.subplots()
+        ax.contourf(Z * np.cos(i / 10), levels=20)
+        return fig
+
+    stats = export_animation(frame, 100, 'field.gif', 'presentation', args=(Z,))
+    """
+    path = os.fspath(path)
+    frames = range(frames) if isinstance(frames, int) else frames
+    sequence = '{' in path
+    suffix = os.path.splitext(path)[1].lower()
+    if not sequence and suffix not in ('.gif', '.png', '.apng'):
+        raise ValueError(f"対応していない出力形式です: {path}")
+    max_workers = max_workers or os.cpu_count() or 1
+    max_in_flight = max_in_flight or 2 * max_workers
+
+    shared = {}
+    start = time.perf_counter()
+    n_frames = 0
+
+    def rendered_frames(executor):
+        """処理中のフレーム数を制限しながら、順番どおりに結果を返す"""
+        pending = deque()
+        for frame in frames:
+            if len(pending) >= max_in_flight:
+                yield pending.popleft().result()
+            pending.append(executor.submit(
+                _run_render_task, _render_frame,
+                (frame_func, frame, sequence) + shared_args))
+        while pending:
+            yield pending.popleft().result()
+
+    try:
+        shared_args = _share_arrays(tuple(args), shared)
+        with ProcessPoolExecutor(max_workers=max_workers,
+                                 initializer=_init_render_worker,
+                                 initargs=(preset_name, kwargs)) as executor:
+            results = rendered_frames(executor)
+            if sequence:
+                for n_frames, png in enumerate(results, start=1):
+                    with open(path.format(n_frames - 1), 'wb') as f:
+                        f.write(png)
+            else:
+                flatten = suffix == '.gif'
+                images = (_frame_image(rgba, flatten) for rgba in results)
+                first = next(images, None)
+                if first is None:
+                    raise ValueError("フレームがありません")
+
+                def counted(images):
+                    nonlocal n_frames
+                    n_frames = 1
+                    for image in images:
+                        n_frames += 1
+                        yield image
+
+                # APNGの書き出しは追加フレームを2回走査するためリストにする
+                rest = counted(images) if flatten else list(counted(images))
+                first.save(path, format='GIF' if flatten else 'PNG',
+                           save_all=True, append_images=rest,
+                           duration=1000 / fps, loop=0)
+    finally:
+        for _, shared_array in shared.values():
+            shared_array.close()
+
+    seconds = time.perf_counter() - start
+    stats = {'frames': n_frames, 'seconds': seconds,
+             'fps': n_frames / seconds if seconds > 0 else 0.0}
+    logger.info("export_animation: %dフレーム, %.2f秒 (%.1f fps)",
+                n_frames, seconds, stats['fps'])
+    return stats
+
+
+# 多系列の一括描画
+def _series_colors(n: int, colors=None, cmap=None) -> list:
+    """系列ごとの色を決める（指定なしはプロパティサイクルを繰り返す）"""
+    if colors is not None:
+        return colors
+    if cmap is not None:
+        return plt.get_cmap(cmap)(np.linspace(0, 1, n))
+    cycle = plt.rcParams['axes.prop_cycle'].by_key().get('color', ['C0'])
+    return [cycle[i % len(cycle)] for i in range(n)]
+
+
+def plot_series(ax, Y, x=None, colors=None, cmap=None,
+                linewidth: Optional[float] = None, labels=None,
+                legend: bool = False, **kwargs):
+    """
+    多数の系列を1つのLineCollectionとして描画
+
+    系列ごとにLine2Dを作らないため、数千系列でも描画と凡例が軽い
+
+    Parameters:
+    -----------
+    ax : matplotlib.axes.Axes
+        描画先のAxes
+    Y : array-like
+        形状 (系列数, 点数) の配列
+    x : array-like, optional
+        全系列共通の (点数,) または系列ごとの (系列数, 点数) のx座標
+    colors : list, optional
+        系列ごとの色
+    cmap : str or Colormap, optional
+        colorsを省略した場合に系列へ割り当てるカラーマップ
+    linewidth : float, optional
+        線幅（省略時はプリセットのlines.linewidth）
+    labels : list of str, optional
+        凡例用のラベル
+    legend : bool
+        Trueの場合のみ凡例用の代理アーティストを作成して凡例を表示
+    **kwargs : dict
+        LineCollectionに渡す追加引数
+
+    Returns:
+    --------
+    LineCollection
+    """
+    Y = np.asarray(Y, dtype=float)
+    if Y.ndim == 1:
+        Y = Y[np.newaxis, :]
+    x = np.arange(Y.shape[1]) if x is None else np.asarray(x, dtype=float)
+    segments = np.stack(np.broadcast_arrays(x, Y), axis=-1)
+
+    colors = _series_colors(len(Y), colors, cmap)
+    linewidth = plt.rcParams['lines.linewidth'] if linewidth is None else linewidth
+    collection = LineCollection(segments, colors=colors, linewidths=linewidth,
+                                **kwargs)
+    ax.add_collection(collection)
+    ax.autoscale_view()
+
+    if legend and labels is not None:
+        # 凡例が必要なときだけ代理アーティストを作る
+        edge_colors = collection.get_colors()
+        handles = [Line2D([], [], color=edge_colors[i % len(edge_colors)],
+                          linewidth=linewidth, label=label)
+                   for i, label in enumerate(labels)]
+        ax.legend(handles=handles)
+    return collection
+
+
+def small_multiples(Ys, x=None, nrows: Optional[int] = None,
+                    ncols: Optional[int] = None, sharex: bool = True,
+                    sharey: bool = True, **kwargs):
+    """
+    系列の組をグリッド状のaxesにplot_seriesで描画
+
+    Parameters:
+    -----------
+    Ys : sequence of array-like
+        各axesに描画する (系列数, 点数) の配列の列
+    x : array-like, optional
+        全axes共通のx座標
+    nrows, ncols : int, optional
+        グリッドの行数・列数（省略時はほぼ正方形になるように決める）
+    sharex, sharey : bool
+        軸を共有するか
+    **kwargs : dict
+        plot_seriesに渡す追加引数
+
+    Returns:
+    --------
+    fig, axes
+    """
+    n = len(Ys)
+    if ncols is None:
+        ncols = int(np.ceil(np.sqrt(n))) if nrows is None else int(np.ceil(n / nrows))
+    if nrows is None:
+        nrows = int(np.ceil(n / ncols))
+    fig, axes = plt.subplots(nrows, ncols, sharex=sharex, sharey=sharey,
+                             squeeze=False)
+    for ax, Y in zip(axes.flat, Ys):
+        plot_series(ax, Y, x=x, **kwargs)
+    for ax in axes.flat[n:]:
+        ax.set_visible(False)
+    return fig, axes
+
+
+# 高速エラーバー
+def _error_bounds(values, err) -> tuple:
+    """スカラー・(N,)・(2, N)の誤差から下端と上端を求める"""
+    err = np.broadcast_to(np.asarray(err, dtype=float), (2, len(values)))
+    if np.any(err < 0):
+        raise ValueError("誤差に負の値は指定できません")
+    return values - err[0], values + err[1]
+
+
+def errorbar_fast(ax, x, y, yerr=None, xerr=None, fmt: str = '',
+                  ecolor=None, elinewidth: Optional[float] = None,
+                  capsize: Optional[float] = None,
+                  capthick: Optional[float] = None, **kwargs):
+    """
+    ax.errorbarと同じ見た目のエラーバーをNumPyで一括計算して描画
+
+    すべてのバーを1つのLineCollection、キャップを方向ごとに1つのLine2D
+    （マーカーのみ）として作成する
+
+    Parameters:
+    -----------
+    ax : matplotlib.axes.Axes
+        描画先のAxes
+    x, y : array-like
+        データ点
+    yerr, xerr : float or array-like, optional
+        スカラー、(N,)、または非対称な (2, N) の誤差
+    fmt : str
+        データ点の書式（'none'でデータ点を描画しない）
+    ecolor : color, optional
+        バーとキャップの色（省略時はデータ点の色）
+    elinewidth : float, optional
+        バーの線幅（省略時はプリセットのlines.linewidth）
+    capsize : float, optional
+        キャップの長さ（ポイント、省略時はerrorbar.capsize）
+    capthick : float, optional
+        キャップの太さ（省略時はlines.markeredgewidth）
+    **kwargs : dict
+        データ点のLine2Dに渡す追加引数
+
+    Returns:
+    --------
+    ErrorbarContainer
+    """
+    x = np.ravel(np.asarray(x, dtype=float))
+    y = np.ravel(np.asarray(y, dtype=float))
+    if len(x) != len(y):
+        raise ValueError(f"xとyの長さが一致しません: {len(x)} != {len(y)}")
+    label = kwargs.pop('label', None)
+    zorder = kwargs.pop('zorder', 2)
+    alpha = kwargs.get('alpha')
+
+    if fmt.lower() == 'none':
+        data_line = None
+        # 色を指定した場合は色のサイクルを進めない（ax.errorbarと同じ）
+        color = kwargs['color'] if 'color' in kwargs else ax._get_lines.get_next_color()
+    else:
+        args = (x, y) if fmt == '' else (x, y, fmt)
+        data_line, = ax.plot(*args, zorder=zorder + 0.1, **kwargs)
+        color = data_line.get_color()
+    ecolor = color if ecolor is None else ecolor
+    if elinewidth is None:
+        elinewidth = plt.rcParams.get('errorbar.elinewidth') or kwargs.get(
+            'linewidth', plt.rcParams['lines.linewidth'])
+    capsize = plt.rcParams['errorbar.capsize'] if capsize is None else capsize
+    capthick = plt.rcParams.get('errorbar.capthick') if capthick is None else capthick
+    if capthick is None:
+        capthick = kwargs.get('markeredgewidth', plt.rcParams['lines.markeredgewidth'])
+
+    segments = []
+    caplines = []
+    for err, dep, indep, marker, horizontal in ((xerr, x, y, '|', True),
+                                                (yerr, y, x, '_', False)):
+        if err is None:
+            continue
+        low, high = _error_bounds(dep, err)
+        if horizontal:
+            segments.append(np.stack([np.column_stack([low, indep]),
+                                      np.column_stack([high, indep])], axis=1))
+            cap_x, cap_y = np.concatenate([low, high]), np.tile(indep, 2)
+        else:
+            segments.append(np.stack([np.column_stack([indep, low]),
+                                      np.column_stack([indep, high])], axis=1))
+            cap_x, cap_y = np.tile(indep, 2), np.concatenate([low, high])
+        if capsize > 0:
+            capline = Line2D(cap_x, cap_y, linestyle='none', marker=marker,
+                             markersize=2.0 * capsize, markeredgewidth=capthick,
+                             markeredgecolor=ecolor, color=ecolor,
+                             alpha=alpha, zorder=zorder)
+            caplines.append(capline)
+
+    barcols = []
+    if segments:
+        bars = LineCollection(np.concatenate(segments), colors=ecolor,
+                              linewidths=elinewidth, alpha=alpha, zorder=zorder)
+        ax.add_collection(bars)
+        barcols.append(bars)
+    # キャップはバーの上に描く
+    for capline in caplines:
+        ax.add_line(capline)
+    ax.autoscale_view()
+
+    container = ErrorbarContainer((data_line, tuple(caplines), tuple(barcols)),
+                                  has_xerr=xerr is not None,
+                                  has_yerr=yerr is not None, label=label)
+    ax.add_container(container)
+    return container
+
+
+# メモリ上での描画
+class RenderResult(NamedTuple):
+    """render() の結果"""
+    data: Union[np.ndarray, bytes]  # RGBA配列（コピーなしのビュー）またはエンコード済みバイト列
+    format: str
+    width: Optional[int]   # ピクセル（ベクター形式はNone）
+    height: Optional[int]  # ピクセル（ベクター形式はNone）
+    dpi: float
+
+
+class _DiscardWriter:
+    """書き込まれたデータを捨てるファイル風オブジェクト（'raw'出力のコピーを省く）"""
+
+    def write(self, data) -> int:
+        return len(data)
+
+    def seek(self, offset: int, whence: int = 0) -> int:
+        # matplotlibはseekを持つオブジェクトをファイルハンドルとして扱う
+        return 0
+
+
+def _is_raster_format(format: str) -> bool:
+    """Aggで描画するラスター形式か（png, jpg, tif, webp, raw, rgba）"""
+    return hasattr(FigureCanvasAgg, f'print_{format}')
+
+
+def _render_figure(fig, format: str, dpi: float, **kwargs) -> RenderResult:
+    """アクティブな設定のもとで図を描画"""
+    if not _is_raster_format(format):
+        buffer = io.BytesIO()
+        fig.savefig(buffer, format=format, dpi=dpi, **kwargs)
+        return RenderResult(buffer.getvalue(), format, None, None, dpi)
+
+    # ラスター形式は呼び出しごとに新しいキャンバス（レンダラー）で描画し、
+    # 前の結果のバッファを上書きしない。ピクセルサイズはtight bboxを反映した
+    # レンダラーから読む
+    original_canvas = fig.canvas
+    canvas = FigureCanvasAgg(fig)
+    try:
+        if format == 'rgba':
+            fig.savefig(_DiscardWriter(), format='raw', dpi=dpi, **kwargs)
+            # レンダラーのバッファをそのまま参照する（ビューがレンダラーを保持する）
+            data = np.asarray(canvas.renderer.buffer_rgba())
+        else:
+            buffer = io.BytesIO()
+            fig.savefig(buffer, format=format, dpi=dpi, **kwargs)
+            data = buffer.getvalue()
+        width, height = int(canvas.renderer.width), int(canvas.renderer.height)
+    finally:
+        fig.set_canvas(original_canvas)
+    return RenderResult(data, format, width, height, dpi)
+
+
+def render(fig, preset_name: Optional[str] = None, format: str = 'rgba',
+           dpi: Optional[float] = None, **kwargs) -> RenderResult:
+    """
+    ファイルを介さずに図を描画
+
+    Parameters:
+    -----------
+    fig : Figure or callable
+        描画する図、または引数なしで図を返す関数（プリセット適用中に呼ばれ、描画後に閉じる）
+    preset_name : str, optional
+        描画時に一時的に適用するプリセット
+    format : str
+        'rgba'ならAggのRGBAバッファをコピーなしのNumPy配列 (高さ, 幅, 4) で返す
+        （呼び出しごとに別のレンダラーで描画するため、前の結果は上書きされない）。
+        'png', 'jpg', 'svg', 'pdf' などはエンコード済みのバイト列を返す。
+        どの形式もsavefig.bbox・savefig.transparentを反映するため、
+        ラスター形式のピクセルサイズは形式によらず一致する
+    dpi : float, optional
+        解像度（省略時はプリセットのsavefig.dpi）
+    **kwargs : dict
+        savefigに渡す追加引数
+
+    Returns:
+    --------
+    RenderResult
+        data, format, width, height, dpi（ベクター形式のwidth, heightはNone）
+
+    Example:
+    --------
+    result = render(fig, 'paper', format='png')
+    return Response(result.data, mimetype='image/png')
+    """
+    style = temp_style(preset_name) if preset_name is not None else nullcontext()
+    with style:
+        built = callable(fig) and not isinstance(fig, mpl.figure.Figure)
+        if built:
+            fig = fig()
+        try:
+            return _render_figure(fig, format, _output_dpi() if dpi is None else dpi,
+                                  **kwargs)
+        finally:
+            if built:
+                plt.close(fig)
+
+
+# 描画結果のキャッシュ
+def data_fingerprint(*arrays, **params) -> str:
+    """
+    配列とパラメータからキャッシュキー用のハッシュを計算
+
+    配列はdtype・形状・内容を、それ以外の値はreprをハッシュに含める
+    """
+    digest = hashlib.blake2b(digest_size=16)
+
+    def update(value) -> None:
+        if isinstance(value, np.ndarray):
+            digest.update(f'{value.dtype.str}{value.shape}'.encode())
+            digest.update(np.ascontiguousarray(value).view(np.uint8).ravel())
+        else:
+            digest.update(repr(value).encode())
+
+    for value in arrays:
+        update(value)
+    # キーワード引数の配列も位置引数と同じく内容をハッシュする
+    for key, value in sorted(params.items()):
+        digest.update(repr(key).encode())
+        update(value)
+    return digest.hexdigest()
+
+
+class RenderCache:
+    """
+    描画結果のLRUキャッシュ
+
+    キーは (データのフィンガープリント, スタイルのスナップショット, 形式, dpi)。
+    合計バイト数がmax_bytesを超えると古いものから削除し、
+    ttlを指定した場合は期限切れのエントリも削除する。
+    stats() でヒット・ミス・削除の回数を取得できる。
+
+    Parameters:
+    -----------
+    max_bytes : int
+        キャッシュする描画結果の合計バイト数の上限
+    ttl : float, optional
+        エントリの有効期間（秒）
+
+    Example:
+    --------
+    cache = RenderCache(max_bytes=512 * 2**20, ttl=600)
+    result = cache.get_or_render(make_figure, data_fingerprint(x, y),
+                                 preset_name='paper', format='png')
+    """
+
+    def __init__(self, max_bytes: int = 256 * 2**20, ttl: Optional[float] = None):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries: 'OrderedDict[tuple, tuple]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @staticmethod
+    def _size(result: RenderResult) -> int:
+        data = result.data
+        return data.nbytes if isinstance(data, np.ndarray) else len(data)
+
+    def _remove(self, key: tuple) -> None:
+        result, _ = self._entries.pop(key)
+        self.current_bytes -= self._size(result)
+
+    def get(self, key: tuple) -> Optional[RenderResult]:
+        """キーに対応する描画結果を返す（なければNone）"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl is not None \
+                    and time.monotonic() - entry[1] > self.ttl:
+                self._remove(key)
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: tuple, result: RenderResult) -> None:
+        """描画結果を登録し、上限を超えた分を古い順に削除"""
+        size = self._size(result)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (result, time.monotonic())
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def get_or_render(self, fig, fingerprint: str,
+                      preset_name: Optional[str] = None, format: str = 'png',
+                      dpi: Optional[float] = None, **kwargs) -> RenderResult:
+        """
+        キャッシュにあればそれを返し、なければrender()で描画して登録
+
+        Parameters:
+        -----------
+        fig : callable or Figure
+            render()に渡す図を作る関数（ヒット時は呼ばれない）
+        fingerprint : str
+            データのフィンガープリント（data_fingerprint()の結果など）
+        preset_name : str, optional
+            描画時に適用するプリセット（省略時は現在のスタイル）
+        format : str
+            出力形式
+        dpi : float, optional
+            解像度（省略時はプリセットのsavefig.dpi）
+        **kwargs : dict
+            savefigに渡す追加引数
+        """
+        style = temp_style(preset_name) if preset_name is not None else nullcontext()
+        with style:
+            snapshot = style_snapshot()
+            dpi = _output_dpi() if dpi is None else dpi
+        key = (fingerprint, snapshot, format, dpi, _freeze_settings(kwargs))
+        result = self.get(key)
+        if result is None:
+            result = render(fig, preset_name, format=format, dpi=dpi, **kwargs)
+            if isinstance(result.data, np.ndarray):
+                # レンダラーのバッファを保持しないようにコピーして登録
+                result = result._replace(data=result.data.copy())
+            self.put(key, result)
+        return result
+
+    def clear(self) -> None:
+        """すべてのエントリを削除"""
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def stats(self) -> dict:
+        """ヒット・ミス・削除の回数と使用量を返す"""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'entries': len(self._entries),
+                'bytes': self.current_bytes,
+                'max_bytes': self.max_bytes,
+            }
+
+
+# 描画コストの見積もり
+# Agg（PNG保存）での描画時間の目安（秒）。環境に合わせて調整できる
+RENDER_COST_COEFFICIENTS = {
+    'base': 0.05,            # 図1枚あたりの固定コスト
+    'pixel': 2.5e-8,         # キャンバスの1ピクセル（塗りつぶし・エンコード）
+    'vertex': 1.5e-7,        # 線・ポリゴンの1頂点（100 dpiあたり、dpiに比例）
+    'marker': 1e-6,          # マーカー・散布図の1点
+    'marker_varied': 2e-5,   # 点ごとに色・サイズが違う散布図の1点（1点ずつ描画される）
+    'marker_area': 1.5e-8,   # マーカーの面積1ピクセル
+    'image_element': 2e-8,   # 画像データの1要素
+    'image_pixel': 7e-7,     # 画像の出力1ピクセル（リサンプリング）
+    'text': 1e-3,            # テキスト1つ
+}
+
+
+class RenderBudgetError(RuntimeError):
+    """描画コストの見積もりが上限を超えた場合に送出される例外"""
+
+
+def _path_vertices(artist) -> int:
+    """コレクションに含まれるパスの頂点数の合計"""
+    return sum(len(path.vertices) for path in artist.get_paths())
+
+
+def estimate_render_cost(fig, dpi: Optional[float] = None) -> dict:
+    """
+    図を描画する前に描画時間とメモリ使用量を見積もる
+
+    アーティストの点数・コレクションの大きさ・画像の大きさと、
+    プリセットのdpiでのピクセル数から計算する
+
+    Parameters:
+    -----------
+    fig : Figure
+        見積もる図
+    dpi : float, optional
+        描画時の解像度（省略時はプリセットのsavefig.dpi）
+
+    Returns:
+    --------
+    dict
+        'width', 'height'（ピクセル）, 'vertices', 'markers', 'image_elements',
+        'texts', 'seconds'（予測時間）, 'bytes'（予測メモリ）
+    """
+    dpi = _output_dpi() if dpi is None else dpi
+    width, height = (int(round(v)) for v in fig.get_size_inches() * dpi)
+    vertices = markers = varied_markers = image_elements = texts = 0
+    marker_area = image_pixels = image_bytes = 0
+    px_per_point = dpi / 72
+
+    for artist in fig.findobj(lambda a: a.get_visible()):
+        if isinstance(artist, Line2D):
+            n_points = len(artist.get_xydata())
+            if artist.get_linestyle() not in ('None', 'none', '', ' '):
+                vertices += n_points
+            if artist.get_marker() not in ('None', 'none', '', ' ', None):
+                markers += n_points
+                marker_area += n_points * (artist.get_markersize() * px_per_point) ** 2
+        elif isinstance(artist, mcollections.PathCollection):
+            n_points = len(artist.get_offsets())
+            sizes = artist.get_sizes()
+            markers += n_points
+            if artist.get_array() is not None or len(sizes) > 1 \
+                    or len(artist.get_facecolors()) > 1:
+                varied_markers += n_points
+            if len(sizes):
+                marker_area += n_points * sizes.mean() * px_per_point ** 2
+        elif isinstance(artist, mcollections.Collection):
+            vertices += _path_vertices(artist)
+        elif isinstance(artist, mimage.AxesImage):
+            array = artist.get_array()
+            if array is not None:
+                bbox = artist.axes.get_position()
+                pixels = int(bbox.width * width * bbox.height * height)
+                image_elements += array.size
+                image_pixels += pixels
+                # 元データ + リサンプリング用の中間バッファ（RGBA×float）
+                image_bytes += array.nbytes + pixels * 16
+        elif isinstance(artist, mtext.Text) and artist.get_text():
+            texts += 1
+
+    coefficients = RENDER_COST_COEFFICIENTS
+    seconds = (coefficients['base']
+               + width * height * coefficients['pixel']
+               + vertices * coefficients['vertex'] * dpi / 100
+               + markers * coefficients['marker']
+               + varied_markers * coefficients['marker_varied']
+               + marker_area * coefficients['marker_area']
+               + image_elements * coefficients['image_element']
+               + image_pixels * coefficients['image_pixel']
+               + texts * coefficients['text'])
+    # キャンバスのRGBAバッファ + 頂点の変換用コピー + 画像
+    n_bytes = width * height * 4 + (vertices + markers) * 16 * 3 + image_bytes
+    return {
+        'width': width,
+        'height': height,
+        'vertices': vertices,
+        'markers': markers,
+        'image_elements': image_elements,
+        'texts': texts,
+        'seconds': seconds,
+        'bytes': n_bytes,
+    }
+
+
+def _decimate_xy(x, y, n_cols: int) -> tuple:
+    """折れ線をx方向のピクセル列ごとの最小・最大値に間引く"""
+    finite = np.isfinite(x)
+    if not finite.any():
+        return x[:0], y[:0]
+    x_min, x_max = x[finite].min(), x[finite].max()
+    scale = n_cols / (x_max - x_min) if x_max > x_min else 0.0
+    y_low = np.full(n_cols, np.inf)
+    y_high = np.full(n_cols, -np.inf)
+    _accumulate_column_minmax(y_low, y_high, x, y, x_min, scale)
+    return _column_minmax_vertices(y_low, y_high, x_min, scale)
+
+
+def _decimate_line(line, n_cols: int) -> None:
+    """折れ線を表示座標のピクセル列で間引く（対数軸でも列の幅が揃う）"""
+    if line.axes is not None:
+        line.axes.viewLim  # 自動スケールを確定させてから座標変換する
+    transform = line.get_transform()
+    xy = transform.transform(np.asarray(line.get_xydata(), dtype=float))
+    x, y = _decimate_xy(xy[:, 0], xy[:, 1], n_cols)
+    data = transform.inverted().transform(np.column_stack([x, y]))
+    line.set_data(data[:, 0], data[:, 1])
+
+
+def _grid_subsample(points, cell: float) -> np.ndarray:
+    """表示座標の点を一辺cellの格子に割り当て、占有セルごとに最初の1点の番号を返す"""
+    finite = np.isfinite(points).all(axis=1)
+    index = np.flatnonzero(finite)
+    if len(index) == 0:
+        return index
+    cells = np.floor(points[finite] / cell).astype(np.int64)
+    cells -= cells.min(axis=0)
+    keys = cells[:, 0] * (cells[:, 1].max() + 1) + cells[:, 1]
+    _, first = np.unique(keys, return_index=True)
+    return index[np.sort(first)]
+
+
+def _subsample_collection(collection, dpi: float) -> None:
+    """散布図の点を重なるものどうしで間引く（点ごとの色・サイズも合わせて間引く）"""
+    if collection.axes is not None:
+        collection.axes.viewLim  # 自動スケールを確定させてから座標変換する
+    offsets = np.asarray(collection.get_offsets(), dtype=float)
+    n = len(offsets)
+    sizes = collection.get_sizes()
+    # マーカー径の半分（最低で出力の1ピクセル）を格子の間隔にする（表示座標のピクセル）
+    diameter = np.sqrt(sizes.max()) if len(sizes) else 0.0
+    cell = max(diameter / 2, 72 / dpi) * collection.figure.dpi / 72
+    keep = _grid_subsample(collection.get_offset_transform().transform(offsets), cell)
+    if len(keep) == n:
+        return
+    array = collection.get_array()
+    facecolors, edgecolors = collection.get_facecolors(), collection.get_edgecolors()
+    linewidths = collection.get_linewidths()
+    collection.set_offsets(offsets[keep])
+    if array is not None and len(array) == n:
+        collection.set_array(array[keep])
+    if len(sizes) == n:
+        collection.set_sizes(sizes[keep])
+    if array is None and len(facecolors) == n:
+        collection.set_facecolors(facecolors[keep])
+    if array is None and len(edgecolors) == n:
+        collection.set_edgecolors(edgecolors[keep])
+    if len(linewidths) == n:
+        collection.set_linewidths(linewidths[keep])
+
+
+def _reduce_render_cost(fig, policy: str, width: int, dpi: float) -> None:
+    """重いアーティストを間引く（decimate）またはラスタ化する（rasterize）"""
+    no_marker = ('None', 'none', '', ' ', None)
+    no_line = ('None', 'none', '', ' ')
+    for artist in fig.findobj(lambda a: a.get_visible()):
+        if isinstance(artist, Line2D):
+            n_points = len(artist.get_xydata())
+            if n_points <= 4 * width:
+                continue
+            if policy == 'decimate' and artist.get_marker() in no_marker:
+                _decimate_line(artist, width)
+            elif policy == 'decimate' and artist.get_linestyle() in no_line:
+                # マーカーのみの線は散布図と同じく重なる点を間引く
+                if artist.axes is not None:
+                    artist.axes.viewLim
+                transform = artist.get_transform()
+                xy = np.asarray(artist.get_xydata(), dtype=float)
+                cell = max(artist.get_markersize() / 2, 72 / dpi) * fig.dpi / 72
+                keep = _grid_subsample(transform.transform(xy), cell)
+                artist.set_data(xy[keep, 0], xy[keep, 1])
+            else:
+                artist.set_rasterized(True)
+        elif isinstance(artist, mcollections.PathCollection):
+            if len(artist.get_offsets()) <= 4 * width:
+                continue
+            if policy == 'decimate':
+                _subsample_collection(artist, dpi)
+            else:
+                artist.set_rasterized(True)
+        elif isinstance(artist, mcollections.Collection):
+            if policy == 'rasterize' and _path_vertices(artist) > 4 * width:
+                artist.set_rasterized(True)
+
+
+def guard_render(fig, policy: str = 'warn', max_seconds: Optional[float] = 10.0,
+                 max_bytes: Optional[int] = 2 * 2**30,
+                 dpi: Optional[float] = None) -> dict:
+    """
+    描画コストを見積もり、上限を超える場合にポリシーに従って対処する
+
+    Parameters:
+    -----------
+    fig : Figure
+        確認する図
+    policy : str
+        'warn'（RuntimeWarning）, 'raise'（RenderBudgetError）,
+        'decimate'（大きな折れ線を表示座標のピクセル列ごとに、散布図・マーカーのみの線を
+        重なる点ごとに間引き、その他の重いアーティストをラスタ化）,
+        'rasterize'（重いアーティストをラスタ化。PDF/SVGなどベクター形式の出力だけが
+        軽くなり、PNGの描画時間は変わらない）のいずれか。
+        対処後の見積もりも上限を超える場合はRuntimeWarningを出す
+    max_seconds : float, optional
+        予測描画時間の上限（秒）
+    max_bytes : int, optional
+        予測メモリ使用量の上限（バイト）
+    dpi : float, optional
+        描画時の解像度（省略時はプリセットのsavefig.dpi）
+
+    Returns:
+    --------
+    dict
+        estimate_render_cost() の結果（対処した場合は対処後の見積もり）
+
+    Example:
+    --------
+    guard_render(fig, policy='decimate', max_seconds=5)
+    fig.savefig('figure.png')
+    """
+    if policy not in ('warn', 'raise', 'decimate', 'rasterize'):
+        raise ValueError(f"不明なポリシー: {policy}")
+    estimate = estimate_render_cost(fig, dpi)
+    over = []
+    if max_seconds is not None and estimate['seconds'] > max_seconds:
+        over.append(f"予測時間 {estimate['seconds']:.1f}秒 > {max_seconds}秒")
+    if max_bytes is not None and estimate['bytes'] > max_bytes:
+        over.append(f"予測メモリ {estimate['bytes'] / 2**20:.0f} MiB > "
+                    f"{max_bytes / 2**20:.0f} MiB")
+    if not over:
+        return estimate
+
+    message = "描画コストが上限を超えています: " + ", ".join(over)
+    if policy == 'raise':
+        raise RenderBudgetError(message)
+    if policy == 'warn':
+        warnings.warn(message, RuntimeWarning, stacklevel=2)
+        return estimate
+    _reduce_render_cost(fig, policy, estimate['width'], _output_dpi() if dpi is None else dpi)
+    logger.info("%s (%sを適用)", message, policy)
+    reduced = estimate_render_cost(fig, dpi)
+    remaining = []
+    if max_seconds is not None and reduced['seconds'] > max_seconds:
+        remaining.append(f"予測時間 {reduced['seconds']:.1f}秒 > {max_seconds}秒")
+    if max_bytes is not None and reduced['bytes'] > max_bytes:
+        remaining.append(f"予測メモリ {reduced['bytes'] / 2**20:.0f} MiB > "
+                         f"{max_bytes / 2**20:.0f} MiB")
+    if remaining:
+        # ラスタ化はAggの描画時間を減らさないため、'rasterize'ではここに来ることが多い
+        warnings.warn(f"{policy}を適用しても描画コストが上限を超えています: "
+                      + ", ".join(remaining), RuntimeWarning, stacklevel=2)
+    return reduced
+
+
+# 複数解像度の書き出し
+def _png_info(metadata: Optional[dict]) -> 'PngImagePlugin.PngInfo':
+    """savefigと同じSoftwareキーを含むPNGのメタデータ"""
+    info = PngImagePlugin.PngInfo()
+    metadata = {'Software': f"Matplotlib version{mpl.__version__}, https://matplotlib.org/",
+                **(metadata or {})}
+    for key, value in metadata.items():
+        if value is not None:
+            info.add_text(key, value)
+    return info
+
+
+def _render_raw(fig, dpi: float, **kwargs) -> np.ndarray:
+    """savefigの設定（bbox・透明度など）を反映してAggでRGBA配列に描画"""
+    original_canvas = fig.canvas
+    canvas = (original_canvas if isinstance(original_canvas, FigureCanvasAgg)
+              else FigureCanvasAgg(fig))
+    try:
+        buffer = io.BytesIO()
+        fig.savefig(buffer, format='raw', dpi=dpi, **kwargs)
+        # savefig後は図のサイズが戻るため、描画に使われたレンダラーから大きさを読む
+        shape = (int(canvas.renderer.height), int(canvas.renderer.width), 4)
+    finally:
+        if canvas is not original_canvas:
+            fig.set_canvas(original_canvas)
+    return np.frombuffer(buffer.getbuffer(), dtype=np.uint8).reshape(shape)
+
+
+def export_dpi_variants(fig, path: str, dpis=(600, 300, 150),
+                        preset_name: Optional[str] = None, **kwargs) -> dict:
+    """
+    最も高いdpiで1回だけ描画し、低いdpiのPNGは縮小して書き出す
+
+    縮小は乗算済みアルファでの面積平均（PillowのBOXフィルタ）で行う。
+    描画はsavefigを通すため、savefig.bbox・savefig.transparent・
+    savefig.facecolorなどのプリセットの設定はそのまま反映される
+
+    Parameters:
+    -----------
+    fig : Figure or callable
+        書き出す図、または引数なしで図を返す関数（プリセット適用中に呼ばれ、書き出し後に閉じる）
+    path : str
+        出力先（'figure_{dpi}dpi.png' のように {dpi} を含める。
+        含まない場合は拡張子の前に '_{dpi}dpi' を付ける）
+    dpis : sequence of float
+        書き出す解像度
+    preset_name : str, optional
+        書き出し時に一時的に適用するプリセット
+    **kwargs : dict
+        savefigに渡す追加引数
+
+    Returns:
+    --------
+    dict
+        'files'（dpi → パス）, 'seconds'（合計時間）
+
+    Example:
+    --------
+    export_dpi_variants(fig, 'figure_{dpi}dpi.png', dpis=(600, 300, 150),
+                        preset_name='paper')
+    """
+    if '{' not in path:
+        stem, extension = os.path.splitext(path)
+        path = f'{stem}_{{dpi}}dpi{extension}'
+    if os.path.splitext(path)[1].lower() != '.png' or kwargs.pop('format', 'png') != 'png':
+        raise ValueError(f"PNG以外の形式には対応していません: {path}")
+    dpis = sorted(set(dpis), reverse=True)
+    if not dpis or dpis[-1] <= 0:
+        raise ValueError(f"dpiは正の値で指定してください: {dpis}")
+    pnginfo = _png_info(kwargs.pop('metadata', None))
+    kwargs.pop('pil_kwargs', None)
+
+    start = time.perf_counter()
+    style = temp_style(preset_name) if preset_name is not None else nullcontext()
+    with style:
+        built = callable(fig) and not isinstance(fig, mpl.figure.Figure)
+        if built:
+            fig = fig()
+        try:
+            rgba = _render_raw(fig, dpis[0], **kwargs)
+        finally:
+            if built:
+                plt.close(fig)
+
+    image = Image.fromarray(rgba)
+    files = {}
+    for dpi in dpis:
+        if dpi != dpis[0]:
+            scale = dpi / dpis[0]
+            size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+            variant = image.resize(size, Image.Resampling.BOX)
+        else:
+            variant = image
+        files[dpi] = path.format(dpi=dpi)
+        variant.save(files[dpi], format='png', dpi=(dpi, dpi), pnginfo=pnginfo)
+    return {'files': files, 'seconds': time.perf_counter() - start}
+
+
+# 複数形式の書き出し
+def _resolve_layout(fig, dpi: float, bbox_inches=None, pad_inches=None):
+    """
+    出力dpiでレイアウトを確定し、savefigに渡すbbox（インチ）を1回だけ計算
+
+    bbox_inches・pad_inchesはsavefigと同じ（省略時はsavefig.bbox・savefig.pad_inches）。
+    'tight'でなければbbox_inchesをそのまま返す
+    """
+    if bbox_inches is None:
+        bbox_inches = plt.rcParams['savefig.bbox']
+    original_canvas = fig.canvas
+    canvas = (original_canvas if isinstance(original_canvas, FigureCanvasAgg)
+              else FigureCanvasAgg(fig))
+    original_dpi = fig.dpi
+    try:
+        # レイアウトエンジンの実行を含む描画なしのパス
+        fig.dpi = dpi
+        fig.draw_without_rendering()
+        if bbox_inches != 'tight':
+            return bbox_inches
+        if pad_inches in (None, 'layout'):
+            pad_inches = plt.rcParams['savefig.pad_inches']
+        return fig.get_tightbbox(canvas.get_renderer()).padded(pad_inches)
+    finally:
+        fig.dpi = original_dpi
+        if canvas is not original_canvas:
+            fig.set_canvas(original_canvas)
+
+
+def _write_file(path: str, data: bytes) -> None:
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def export(fig, path_stem: str, formats=('png', 'pdf', 'svg'),
+           preset_name: Optional[str] = None, dpi: Optional[float] = None,
+           max_workers: Optional[int] = None, **kwargs) -> dict:
+    """
+    図を複数の形式で書き出す（レイアウトとtight bboxの計算は1回だけ）
+
+    各形式の描画はメモリ上で順番に行い（matplotlibはスレッドセーフではないため）、
+    ファイルへの書き込みは次の形式の描画と並行して行う
+
+    Parameters:
+    -----------
+    fig : Figure or callable
+        書き出す図、または引数なしで図を返す関数（プリセット適用中に呼ばれ、書き出し後に閉じる）
+    path_stem : str
+        拡張子を除いた出力先（'figure' → figure.png, figure.pdf, ...）
+    formats : sequence of str
+        出力形式
+    preset_name : str, optional
+        書き出し時に一時的に適用するプリセット
+    dpi : float, optional
+        ラスター形式の解像度（省略時はプリセットのsavefig.dpi）
+    max_workers : int, optional
+        ファイル書き込みのスレッド数
+    **kwargs : dict
+        savefigに渡す追加引数
+
+    Returns:
+    --------
+    dict
+        'files'（形式 → パス）, 'seconds'（形式 → 描画時間）,
+        'layout_seconds'（レイアウトとbboxの計算時間）, 'total_seconds'
+
+    Example:
+    --------
+    result = export(fig, 'figures/result', formats=['png', 'pdf', 'svg'],
+                    preset_name='paper')
+    print(result['seconds'])  # {'png': ..., 'pdf': ..., 'svg': ...}
+    """
+    formats = list(dict.fromkeys(formats))
+    supported = FigureCanvasAgg.get_supported_filetypes()
+    unknown = [fmt for fmt in formats if fmt not in supported]
+    if unknown:
+        raise ValueError(f"不明な形式: {', '.join(unknown)}")
+
+    start = time.perf_counter()
+    files, seconds = {}, {}
+    style = temp_style(preset_name) if preset_name is not None else nullcontext()
+    with style, ThreadPoolExecutor(max_workers=max_workers) as executor:
+        built = callable(fig) and not isinstance(fig, mpl.figure.Figure)
+        if built:
+            fig = fig()
+        layout_engine = fig.get_layout_engine()
+        try:
+            dpi = _output_dpi() if dpi is None else dpi
+            bbox_inches = _resolve_layout(fig, dpi, kwargs.pop('bbox_inches', None),
+                                          kwargs.pop('pad_inches', None))
+            layout_seconds = time.perf_counter() - start
+            # 確定したレイアウトを各形式で使い回す（エンジンがなければ何もしない）
+            fig.set_layout_engine('none')
+            writes = []
+            for fmt in formats:
+                format_start = time.perf_counter()
+                buffer = io.BytesIO()
+                fig.savefig(buffer, format=fmt, dpi=dpi, bbox_inches=bbox_inches, **kwargs)
+                seconds[fmt] = time.perf_counter() - format_start
+                files[fmt] = f'{path_stem}.{fmt}'
+                writes.append(executor.submit(_write_file, files[fmt], buffer.getvalue()))
+            for write in writes:
+                write.result()
+        finally:
+            if built:
+                plt.close(fig)
+            elif layout_engine is not None:
+                fig.set_layout_engine(layout_engine)
+
+    return {
+        'files': files,
+        'seconds': seconds,
+        'layout_seconds': layout_seconds,
+        'total_seconds': time.perf_counter() - start,
+    }
+
+
+# 巨大なヒートマップ用の画像ピラミッド
+class ImagePyramid:
+    """
+    2次元配列のミップマップ（1/2ずつブロック平均で縮小した配列の列）
+
+    レベル0は元の配列（コピーしない）。cache_dirを指定すると各レベルを
+    .npyファイルのメモリマップとして保存し、元データが同じなら次回以降は再利用する
+
+    Parameters:
+    -----------
+    data : array-like, np.memmap or path
+        2次元配列（.npyファイルのパスも可）
+    cache_dir : str, optional
+        縮小したレベルを保存するディレクトリ
+    min_size : int
+        最も粗いレベルの長辺のピクセル数の目安
+    chunk_size : int
+        縮小時に1回に読み込むおおよその要素数
+
+    Example:
+    --------
+    pyramid = ImagePyramid('field.npy', cache_dir='field_pyramid')
+    heatmap_pyramid(ax1, pyramid, cmap='viridis')
+    heatmap_pyramid(ax2, pyramid, cmap='magma')  # 同じピラミッドを再利用
+    """
+
+    def __init__(self, data, cache_dir: Optional[str] = None, min_size: int = 256,
+                 chunk_size: int = DEFAULT_CHUNK_SIZE):
+        source = data
+        data = _load_array(data)
+        if data.ndim != 2:
+            raise ValueError(f"2次元配列を指定してください: shape={data.shape}")
+        self.levels = [data]
+        self.dtype = np.result_type(data.dtype, np.float32)
+        signature = self._signature(source, data) if cache_dir is not None else None
+        if cache_dir is not None:
+            if self._load(cache_dir, signature):
+                return
+            # 縮小レベルがない（小さい入力）場合もpyramid.jsonを書けるように先に作成
+            os.makedirs(cache_dir, exist_ok=True)
+
+        # 値の範囲はレベル0を読むときに一緒に求める
+        self.vmin, self.vmax = np.inf, -np.inf
+        level = data
+        while max(level.shape) > min_size:
+            level = self._reduce(level, chunk_size, cache_dir, len(self.levels))
+            self.levels.append(level)
+        if len(self.levels) == 1:
+            self._update_range(data)
+        if self.vmin > self.vmax:
+            self.vmin = self.vmax = None
+        if cache_dir is not None:
+            with open(os.path.join(cache_dir, 'pyramid.json'), 'w') as f:
+                json.dump({'signature': signature, 'levels': len(self.levels),
+                           'vmin': self.vmin, 'vmax': self.vmax}, f)
+
+    @staticmethod
+    def _signature(source, data) -> str:
+        """元データの識別子（ファイルならパスと更新時刻、配列なら内容のハッシュ）"""
+        if isinstance(source, (str, os.PathLike)):
+            stat = os.stat(source)
+            return f'{os.path.abspath(source)}:{stat.st_size}:{stat.st_mtime_ns}'
+        return data_fingerprint(np.asarray(data))
+
+    def _load(self, cache_dir: str, signature: str) -> bool:
+        """保存済みのレベルが元データと一致すれば読み込む"""
+        try:
+            with open(os.path.join(cache_dir, 'pyramid.json')) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if meta.get('signature') != signature:
+            return False
+        try:
+            levels = [np.load(os.path.join(cache_dir, f'level{k}.npy'), mmap_mode='r')
+                      for k in range(1, meta['levels'])]
+        except (OSError, ValueError):
+            return False
+        self.levels.extend(levels)
+        self.vmin, self.vmax = meta['vmin'], meta['vmax']
+        return True
+
+    def _update_range(self, block) -> None:
+        finite = np.asarray(block, dtype=float)
+        finite = finite[np.isfinite(finite)]
+        if finite.size:
+            self.vmin = min(self.vmin, float(finite.min()))
+            self.vmax = max(self.vmax, float(finite.max()))
+
+    def _reduce(self, level, chunk_size: int, cache_dir: Optional[str], index: int):
+        """1つ上のレベルを行方向のチャンクごとに2×2のブロック平均で作成"""
+        n_rows, n_cols = level.shape
+        shape = (-(-n_rows // 2), -(-n_cols // 2))
+        if cache_dir is not None:
+            reduced = np.lib.format.open_memmap(os.path.join(cache_dir, f'level{index}.npy'),
+                                                mode='w+', dtype=self.dtype, shape=shape)
+        else:
+            reduced = np.empty(shape, dtype=self.dtype)
+        # チャンクの行数は偶数にそろえる
+        rows_per_chunk = max(chunk_size // max(n_cols, 1) // 2, 1) * 2
+        for chunk in _iter_chunks(n_rows, rows_per_chunk):
+            block = level[chunk]
+            if index == 1:
+                self._update_range(block)
+            reduced[chunk.start // 2:-(-chunk.stop // 2)] = _block_reduce(block, 2, 2)
+        if cache_dir is not None:
+            reduced.flush()
+            reduced = np.load(reduced.filename, mmap_mode='r')
+        return reduced
+
+    @property
+    def shape(self) -> tuple:
+        return self.levels[0].shape
+
+    def level_for(self, factor: float) -> int:
+        """1ピクセルあたりの元データの要素数がfactorのときに使うレベル"""
+        level = int(np.floor(np.log2(factor))) if factor > 1 else 0
+        return min(level, len(self.levels) - 1)
+
+
+class PyramidImage(mimage.AxesImage):
+    """
+    描画のたびにaxesのピクセル数と表示範囲に合ったピラミッドのレベルを選び、
+    表示範囲の部分だけを切り出して描画するAxesImage
+    """
+
+    def __init__(self, ax, pyramid: ImagePyramid, **kwargs):
+        super().__init__(ax, **kwargs)
+        self.pyramid = pyramid
+        self.drawn_level = None
+
+    def _edges(self) -> tuple:
+        """行・列の境界（0〜要素数）をデータ座標に写す係数"""
+        left, right, bottom, top = self.get_extent()
+        if self.origin == 'upper':
+            bottom, top = top, bottom
+        return left, right, bottom, top
+
+    def _visible_window(self, n_rows: int, n_cols: int) -> tuple:
+        """表示範囲に含まれるレベル0の行・列の範囲"""
+        left, right, first, last = self._edges()
+        (x0, y0), (x1, y1) = self.axes.viewLim.get_points()
+        cols = np.sort((np.array([x0, x1]) - left) / (right - left) * n_cols)
+        rows = np.sort((np.array([y0, y1]) - first) / (last - first) * n_rows)
+        c0, c1 = np.clip([np.floor(cols[0]), np.ceil(cols[1])], 0, n_cols).astype(int)
+        r0, r1 = np.clip([np.floor(rows[0]), np.ceil(rows[1])], 0, n_rows).astype(int)
+        return r0, r1, c0, c1
+
+    def make_image(self, renderer, magnification=1.0, unsampled=False):
+        n_rows, n_cols = self.pyramid.shape
+        r0, r1, c0, c1 = self._visible_window(n_rows, n_cols)
+        if r1 <= r0 or c1 <= c0:
+            return None, 0, 0, None
+        # axesのピクセル数（描画時のdpi）に対する表示範囲の要素数の比でレベルを決める
+        width = max(self.axes.bbox.width * magnification, 1)
+        height = max(self.axes.bbox.height * magnification, 1)
+        level = self.pyramid.level_for(min((c1 - c0) / width, (r1 - r0) / height))
+        scale = 2 ** level
+        data = self.pyramid.levels[level]
+        r0k, c0k = r0 // scale, c0 // scale
+        r1k, c1k = min(-(-r1 // scale), data.shape[0]), min(-(-c1 // scale), data.shape[1])
+
+        left, right, first, last = self._edges()
+
+        def x(c):
+            return left + (right - left) * min(c * scale, n_cols) / n_cols
+
+        def y(r):
+            return first + (last - first) * min(r * scale, n_rows) / n_rows
+
+        if self.origin == 'upper':
+            extent = (x(c0k), x(c1k), y(r1k), y(r0k))
+        else:
+            extent = (x(c0k), x(c1k), y(r0k), y(r1k))
+
+        # 切り出した部分を一時的に画像データとして使う（set_dataは再描画を誘発するため使わない）
+        full_data, full_extent = self._A, self._extent
+        self._A = np.asarray(data[r0k:r1k, c0k:c1k])
+        self._extent = extent
+        self._imcache = None
+        try:
+            self.drawn_level = level
+            return super().make_image(renderer, magnification, unsampled)
+        finally:
+            self._A, self._extent = full_data, full_extent
+            self._imcache = None
+
+
+def heatmap_pyramid(ax, data, cache_dir: Optional[str] = None, min_size: int = 256,
+                    chunk_size: int = DEFAULT_CHUNK_SIZE, **kwargs) -> PyramidImage:
+    """
+    巨大な2次元配列を画像ピラミッドで描画
+
+    描画のたびにaxesのピクセル数（保存時はそのdpi）と表示範囲から
+    必要な解像度のレベルを選ぶため、拡大表示でも600 dpiでの保存でも
+    必要な分のデータしか読み込まない
+
+    Parameters:
+    -----------
+    ax : matplotlib.axes.Axes
+        描画先のAxes
+    data : ImagePyramid, array-like, np.memmap or path
+        2次元配列（.npyファイルのパスも可）、または作成済みのピラミッド
+    cache_dir : str, optional
+        ピラミッドを保存するディレクトリ（ImagePyramidを参照）
+    min_size : int
+        最も粗いレベルの長辺のピクセル数の目安
+    chunk_size : int
+        縮小時に1回に読み込むおおよその要素数
+    **kwargs : dict
+        ax.imshowと同じ引数（cmap, norm, vmin, vmax, origin, extent, aspectなど）
+
+    Returns:
+    --------
+    PyramidImage
+    """
+    pyramid = (data if isinstance(data, ImagePyramid)
+               else ImagePyramid(data, cache_dir, min_size, chunk_size))
+    n_rows, n_cols = pyramid.shape
+    aspect = kwargs.pop('aspect', plt.rcParams['image.aspect'])
+    vmin = kwargs.pop('vmin', None)
+    vmax = kwargs.pop('vmax', None)
+    alpha = kwargs.pop('alpha', None)
+    if kwargs.get('norm') is None and vmin is None and vmax is None:
+        vmin, vmax = pyramid.vmin, pyramid.vmax
+    origin = kwargs.setdefault('origin', plt.rcParams['image.origin'])
+    if kwargs.get('extent') is None:
+        if origin == 'lower':
+            kwargs['extent'] = (-0.5, n_cols - 0.5, -0.5, n_rows - 0.5)
+        else:
+            kwargs['extent'] = (-0.5, n_cols - 0.5, n_rows - 0.5, -0.5)
+
+    ax.set_aspect(aspect)
+    image = PyramidImage(ax, pyramid, **kwargs)
+    # 通常時（カーソル表示など）は最も粗いレベルを保持する
+    image.set_data(pyramid.levels[-1])
+    image.set_alpha(alpha)
+    image.set_clim(vmin, vmax)
+    if image.get_clip_path() is None:
+        image.set_clip_path(ax.patch)
+    image.set_extent(image.get_extent())
+    ax.add_image(image)
+    return image
+
+
+# ベクトル場（流線・矢印）
+STREAMLINE_CACHE_SIZE = 32
+_streamline_cache: 'OrderedDict[str, list]' = OrderedDict()
+_streamline_cache_lock = threading.Lock()
+
+# 流線の積分に影響する streamplot の引数（キャッシュキーに含める）
+_STREAMLINE_INTEGRATION_KEYS = ('minlength', 'maxlength', 'start_points',
+                                'integration_direction', 'broken_streamlines',
+                                'integration_max_step_scale',
+                                'integration_max_error_scale')
+
+
+def _interp_grid(a, xg, yg):
+    """格子座標 (xg, yg) での双線形補間（配列版、aは (ny, nx) または (ny, nx, k)）"""
+    ny, nx = a.shape[:2]
+    x0 = np.clip(xg.astype(np.int64), 0, nx - 1)
+    y0 = np.clip(yg.astype(np.int64), 0, ny - 1)
+    x1 = np.minimum(x0 + 1, nx - 1)
+    y1 = np.minimum(y0 + 1, ny - 1)
+    tx, ty = xg - x0, yg - y0
+    if a.ndim == 3:
+        tx, ty = tx[:, None], ty[:, None]
+    return ((a[y0, x0] * (1 - tx) + a[y0, x1] * tx) * (1 - ty)
+            + (a[y1, x0] * (1 - tx) + a[y1, x1] * tx) * ty)
+
+
+def _spiral_order(nx: int, ny: int) -> np.ndarray:
+    """マスクのセルを外周から内側へ渦巻き状にたどる順序（streamplotと同様）"""
+    ym, xm = np.mgrid[0:ny, 0:nx]
+    ring = np.minimum.reduce([xm, ym, nx - 1 - xm, ny - 1 - ym])
+    right, top = nx - 1 - ring, ny - 1 - ring
+    side = np.select([(ym == ring) & (xm < right), (xm == right) & (ym < top),
+                      (ym == top) & (xm > ring)], [0, 1, 2], 3)
+    along = np.choose(side, [xm, ym, nx - 1 - xm, ny - 1 - ym])
+    return np.lexsort((along.ravel(), side.ravel(), ring.ravel()))
+
+
+def _integrate_lockstep(seeds, field, ds: float, n_steps: int) -> np.ndarray:
+    """
+    すべての始点をRK2（Heun法）で同時に積分
+
+    fieldは (ny, nx, 3) の格子座標での速度 (u, v) と軸座標での速さ
+
+    Returns:
+    --------
+    ndarray
+        (n_steps + 1, 始点数, 2) の格子座標（領域外に出た後はNaN）
+    """
+    ny, nx = field.shape[:2]
+    path = np.full((n_steps + 1, len(seeds), 2), np.nan)
+    path[0] = seeds
+    position = np.array(seeds, dtype=float)
+    index = np.arange(len(seeds))
+
+    def inside(p):
+        return ((p[:, 0] >= 0) & (p[:, 0] <= nx - 1)
+                & (p[:, 1] >= 0) & (p[:, 1] <= ny - 1))
+
+    def direction(p):
+        values = _interp_grid(field, p[:, 0], p[:, 1])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return values[:, :2] / values[:, 2:]
+
+    for step in range(1, n_steps + 1):
+        k1 = direction(position)
+        midpoint = position + ds * k1
+        k2 = direction(np.clip(midpoint, 0, [nx - 1, ny - 1]))
+        moved = position + 0.5 * ds * (k1 + k2)
+        alive = inside(midpoint) & inside(moved) & np.isfinite(moved).all(axis=1)
+        index, position = index[alive], moved[alive]
+        if len(index) == 0:
+            return path[:step]
+        path[step, index] = position
+    return path
+
+
+def _walk_mask(cells, occupied, start_owned: bool) -> tuple:
+    """
+    マスクのセル列をたどり、使用済みのセルに入る直前までの点数と通過したセルを返す
+    """
+    change = np.flatnonzero(np.r_[True, cells[1:] != cells[:-1]])
+    visited = cells[change]
+    revisit = np.ones(len(visited), dtype=bool)
+    revisit[np.unique(visited, return_index=True)[1]] = False
+    blocked = occupied[visited] | revisit
+    if start_owned:
+        blocked[0] = False
+    stop = np.flatnonzero(blocked)
+    if len(stop) == 0:
+        return len(cells), visited
+    return change[stop[0]], visited[:stop[0]]
+
+
+def _integrate_streamlines_vectorized(x, y, u, v, density=1, minlength: float = 0.1,
+                                      maxlength: float = 4.0, start_points=None,
+                                      integration_direction: str = 'both',
+                                      broken_streamlines: bool = True,
+                                      integration_max_step_scale: float = 1.0,
+                                      integration_max_error_scale: float = 1.0) -> list:
+    """
+    streamplotと同じ格子・マスクで、全始点を同時に積分してから
+    マスクによる打ち切りを始点の順に適用する（固定刻みのRK2）
+    """
+    grid = mstreamplot.Grid(x, y)
+    mask_shape = mstreamplot.StreamMask(density).shape
+    if integration_direction not in ('both', 'forward', 'backward'):
+        raise ValueError(f"不明な積分方向: {integration_direction}")
+    if integration_direction == 'both':
+        maxlength /= 2
+    u = np.ma.filled(np.ma.masked_invalid(u).astype(float), np.nan) / grid.dx
+    v = np.ma.filled(np.ma.masked_invalid(v).astype(float), np.nan) / grid.dy
+    speed = np.hypot(u / (grid.nx - 1), v / (grid.ny - 1))
+    speed[speed == 0] = np.nan
+    field = np.dstack([u, v, speed])
+
+    mny, mnx = mask_shape
+    to_mask = np.array([(mnx - 1) / (grid.nx - 1), (mny - 1) / (grid.ny - 1)])
+    if start_points is None:
+        order = _spiral_order(mnx, mny)
+        seeds = np.column_stack([order % mnx, order // mnx]) / to_mask
+    else:
+        points = np.asarray(start_points, dtype=float)
+        seeds = np.column_stack([(points[:, 0] - grid.x_origin) / grid.dx,
+                                 (points[:, 1] - grid.y_origin) / grid.dy])
+        seeds = np.clip(seeds, 0, [grid.nx - 1, grid.ny - 1])
+
+    # 刻み幅はstreamplotの最大刻み（マスクのセルを飛ばさない大きさ）に固定する
+    ds = min(1 / mnx, 1 / mny, 0.1) * integration_max_step_scale
+    n_steps = max(int(maxlength / ds), 1)
+    paths = {}
+    if integration_direction in ('both', 'backward'):
+        paths['backward'] = _integrate_lockstep(seeds, field * [-1, -1, 1], ds, n_steps)
+    if integration_direction in ('both', 'forward'):
+        paths['forward'] = _integrate_lockstep(seeds, field, ds, n_steps)
+
+    occupied = np.zeros(mnx * mny, dtype=bool)
+
+    def cells_of(path):
+        xm, ym = np.rint(path * to_mask).astype(np.int64).T
+        return ym * mnx + xm
+
+    trajectories = []
+    for i, seed in enumerate(seeds):
+        if occupied[cells_of(seed[None])[0]]:
+            continue
+        parts, marked, length = [], [], 0.0
+        # 後ろ向きを先に積分し、前向きは始点のセルから出発する（streamplotと同じ順序）
+        for name, start_owned in (('backward', False), ('forward', True)):
+            if name not in paths:
+                continue
+            path = paths[name][:, i]
+            path = path[:np.count_nonzero(np.isfinite(path[:, 0]))]
+            cells = cells_of(path)
+            if broken_streamlines:
+                n_points, visited = _walk_mask(cells, occupied, start_owned and bool(parts))
+            else:
+                n_points, visited = len(cells), np.unique(cells)
+            occupied[visited] = True
+            marked.append(visited)
+            length += (n_points - 1) * ds
+            parts.append(path[:n_points][::-1] if name == 'backward'
+                         else path[1 if parts else 0:n_points])
+        if length > minlength:
+            trajectory = np.concatenate(parts)
+            trajectories.append(np.column_stack([
+                grid.x_origin + trajectory[:, 0] * grid.dx,
+                grid.y_origin + trajectory[:, 1] * grid.dy]))
+        else:
+            occupied[np.concatenate(marked)] = False
+    return trajectories
+
+
+def _integrate_streamlines(x, y, u, v, density=1, **integration) -> list:
+    """matplotlibのstreamplotで流線を積分し、データ座標の折れ線のリストを返す"""
+    fig = mpl.figure.Figure()
+    result = mstreamplot.streamplot(fig.add_subplot(), x, y, u, v, density=density,
+                                    color='k', linewidth=1, num_arrows=0, **integration)
+    return [np.asarray(segment) for segment in result.lines.get_segments()]
+
+
+def _cached_streamlines(x, y, u, v, density, method: str, integration: dict) -> list:
+    """積分済みの流線をフィールドのハッシュと密度・積分の設定をキーにキャッシュ"""
+    key = data_fingerprint(*(np.asarray(a, dtype=float) for a in (x, y, u, v)),
+                           density=np.broadcast_to(density, 2).tolist(), method=method,
+                           **{k: np.asarray(value) if k == 'start_points' else value
+                              for k, value in integration.items()})
+    with _streamline_cache_lock:
+        if key in _streamline_cache:
+            _streamline_cache.move_to_end(key)
+            return _streamline_cache[key]
+    integrate = (_integrate_streamlines_vectorized if method == 'vectorized'
+                 else _integrate_streamlines)
+    trajectories = integrate(x, y, u, v, density, **integration)
+    with _streamline_cache_lock:
+        _streamline_cache[key] = trajectories
+        while len(_streamline_cache) > STREAMLINE_CACHE_SIZE:
+            _streamline_cache.popitem(last=False)
+    return trajectories
+
+
+def clear_streamline_cache() -> None:
+    """streamplot_cachedのキャッシュを削除"""
+    with _streamline_cache_lock:
+        _streamline_cache.clear()
+
+
+def streamplot_cached(ax, x, y, u, v, density=1, method: str = 'matplotlib',
+                      linewidth=None, color=None, cmap=None, norm=None,
+                      arrowsize: float = 1, arrowstyle: str = '-|>', transform=None,
+                      zorder=None, num_arrows: int = 1, **integration):
+    """
+    積分済みの流線をキャッシュして再利用するstreamplot
+
+    同じフィールド・密度・積分の設定なら、プリセットや図が変わっても
+    流線の積分をやり直さず、線と矢印だけを作り直す
+
+    Parameters:
+    -----------
+    ax : matplotlib.axes.Axes
+        描画先のAxes
+    x, y, u, v : array-like
+        ax.streamplotと同じ格子と速度
+    density : float or (float, float)
+        流線の密度
+    method : str
+        'matplotlib'（streamplotと同じ積分、結果も同じ）または
+        'vectorized'（全始点を固定刻みのRK2でNumPyにより同時に積分）
+    linewidth, color, cmap, norm, arrowsize, arrowstyle, transform, zorder, num_arrows
+        ax.streamplotと同じ描画の引数
+    **integration : dict
+        minlength, maxlength, start_points, integration_direction,
+        broken_streamlines など積分に関する ax.streamplot の引数
+
+    Returns:
+    --------
+    StreamplotSet
+        lines（LineCollection）, arrows（PatchCollection）
+    """
+    if method not in ('matplotlib', 'vectorized'):
+        raise ValueError(f"不明な積分方法: {method}")
+    unknown = set(integration) - set(_STREAMLINE_INTEGRATION_KEYS)
+    if unknown:
+        raise TypeError(f"不明な引数: {', '.join(sorted(unknown))}")
+    trajectories = _cached_streamlines(x, y, u, v, density, method, integration)
+
+    grid = mstreamplot.Grid(x, y)
+    transform = ax.transData if transform is None else transform
+    zorder = Line2D.zorder if zorder is None else zorder
+    color = ax._get_lines.get_next_color() if color is None else color
+    linewidth = plt.rcParams['lines.linewidth'] if linewidth is None else linewidth
+    multicolor = isinstance(color, np.ndarray)
+    varying_width = isinstance(linewidth, np.ndarray)
+    line_kw = {'zorder': zorder}
+    arrow_kw = {'arrowstyle': arrowstyle, 'mutation_scale': 10 * arrowsize,
+                'zorder': zorder}
+    if multicolor:
+        color = np.ma.filled(np.ma.masked_invalid(color).astype(float), np.nan)
+        norm = mpl.colors.Normalize(np.nanmin(color), np.nanmax(color)) if norm is None else norm
+        cmap = plt.get_cmap(cmap)
+    else:
+        line_kw['color'] = arrow_kw['color'] = color
+    if not varying_width:
+        line_kw['linewidth'] = arrow_kw['linewidth'] = linewidth
+
+    streamlines, widths, values, arrows = [], [], [], []
+    for trajectory in trajectories:
+        tx, ty = trajectory.T
+        xg, yg = (tx - grid.x_origin) / grid.dx, (ty - grid.y_origin) / grid.dy
+        if varying_width or multicolor:
+            streamlines.extend(np.stack([trajectory[:-1], trajectory[1:]], axis=1))
+        else:
+            streamlines.append(trajectory)
+        if varying_width:
+            line_widths = _interp_grid(linewidth, xg, yg)[:-1]
+            widths.append(line_widths)
+        if multicolor:
+            color_values = _interp_grid(color, xg, yg)[:-1]
+            values.append(color_values)
+
+        distance = np.cumsum(np.hypot(np.diff(tx), np.diff(ty)))
+        for k in range(1, num_arrows + 1):
+            i = np.searchsorted(distance, distance[-1] * (k / (num_arrows + 1)))
+            if varying_width:
+                arrow_kw['linewidth'] = line_widths[i]
+            if multicolor:
+                arrow_kw['color'] = cmap(norm(color_values[i]))
+            arrows.append(mpl.patches.FancyArrowPatch(
+                (tx[i], ty[i]), (np.mean(tx[i:i + 2]), np.mean(ty[i:i + 2])),
+                transform=transform, **arrow_kw))
+
+    if varying_width:
+        line_kw['linewidth'] = np.concatenate(widths) if widths else []
+    lines = LineCollection(streamlines, transform=transform, **line_kw)
+    lines.sticky_edges.x[:] = [grid.x_origin, grid.x_origin + grid.width]
+    lines.sticky_edges.y[:] = [grid.y_origin, grid.y_origin + grid.height]
+    if multicolor:
+        lines.set_array(np.concatenate(values) if values else np.array([]))
+        lines.set_cmap(cmap)
+        lines.set_norm(norm)
+    ax.add_collection(lines)
+    # 矢印は流線の上にあるため、データ範囲の更新（add_patch）は省く
+    for arrow in arrows:
+        ax.add_artist(arrow)
+    ax.autoscale_view()
+    return mstreamplot.StreamplotSet(lines, mcollections.PatchCollection(arrows))
+
+
+def quiver_auto(ax, X, Y, U, V, *args, spacing: Optional[float] = None, **kwargs):
+    """
+    プリセットの図のサイズとdpiから矢印の間隔を決めて間引いたquiver
+
+    Parameters:
+    -----------
+    ax : matplotlib.axes.Axes
+        描画先のAxes
+    X, Y : array-like
+        1次元または2次元の格子座標
+    U, V : array-like
+        2次元の速度
+    spacing : float, optional
+        矢印の間隔（ポイント、省略時はフォントサイズの2.5倍）
+    *args, **kwargs
+        ax.quiverに渡す追加引数（Cなど）
+
+    Returns:
+    --------
+    Quiver
+    """
+    U, V = np.asarray(U), np.asarray(V)
+    ny, nx = U.shape
+    spacing = 2.5 * plt.rcParams['font.size'] if spacing is None else spacing
+    width, height = _target_resolution(ax)
+    spacing_px = spacing * _output_dpi() / 72
+    skip_x = max(int(np.ceil(nx * spacing_px / width)), 1)
+    skip_y = max(int(np.ceil(ny * spacing_px / height)), 1)
+    # 間引いた矢印が領域の中央にそろうように開始位置をずらす
+    rows = slice((ny - 1) % skip_y // 2, None, skip_y)
+    cols = slice((nx - 1) % skip_x // 2, None, skip_x)
+    X, Y = np.asarray(X), np.asarray(Y)
+    X = X[rows, cols] if X.ndim == 2 else X[cols]
+    Y = Y[rows, cols] if Y.ndim == 2 else Y[rows]
+    args = tuple(np.asarray(a)[rows, cols] if np.ndim(a) == 2 else a for a in args)
+    return ax.quiver(X, Y, U[rows, cols], V[rows, cols], *args, **kwargs)
+
+
+# コールドスタート用スナップショット
+SNAPSHOT_FORMAT = 1
+
+# スナップショットを読み込んだ場合はその内容（import時に設定）
+_snapshot: Optional[dict] = None
+
+
+def _style_signature() -> str:
+    """プリセットと共通設定の内容のハッシュ（スナップショットの検証用）"""
+    common = _apply_common_settings.__code__
+    return data_fingerprint(presets=PRESETS, common=(common.co_code, common.co_consts))
+
+
+def _compile_preset(preset_name: str) -> dict:
+    """matplotlibのデフォルトに対してプリセットが変更するrcParamsを求める"""
+    global _current_style, _default_math_spacing
+    settings = _style_settings(preset_name)
+    # apply_styleが変更するモジュールの状態もtemp_styleと同じく元に戻す
+    original_style = _current_style
+    original_math_spacing = _default_math_spacing
+    with mpl.rc_context():
+        try:
+            mpl.rcdefaults()
+            apply_style(preset_name)
+            compiled = {}
+            for key, value in plt.rcParams.items():
+                if key in ('backend', 'backend_fallback'):
+                    continue
+                if key in settings or value != mpl.rcParamsDefault[key]:
+                    try:
+                        compiled[key] = json.loads(json.dumps(value))
+                    except TypeError:
+                        continue
+        finally:
+            _current_style = original_style
+            _default_math_spacing = original_math_spacing
+    return compiled
+
+
+def _resolve_preset_fonts(preset_name: str) -> List[str]:
+    """プリセットの本文フォント（通常・太字）のファイル"""
+    with temp_style(preset_name):
+        return sorted({font_manager.findfont(font_manager.FontProperties(
+            family=plt.rcParams['font.family'], weight=weight)) for weight in ('normal', 'bold')})
+
+
+def build_snapshot(directory: str) -> str:
+    """
+    コールドスタート用のスナップショットを作成
+
+    フォント一覧のキャッシュ、プリセットが使うフォントファイル、
+    プリセットごとのrcParamsを保存する。コンテナイメージの作成時に
+    ``python -m mpl_config snapshot DIR`` で作成し、実行時に環境変数
+    MPL_CONFIG_SNAPSHOT=DIR を設定すると、import時にフォントキャッシュの
+    作成とスタイルの計算を省略できる
+
+    Parameters:
+    -----------
+    directory : str
+        保存先のディレクトリ
+
+    Returns:
+    --------
+    str
+        snapshot.json のパス
+    """
+    config_dir = os.path.join(directory, 'mplconfig')
+    os.makedirs(config_dir, exist_ok=True)
+    # matplotlibがMPLCONFIGDIRから読むファイル名で保存する
+    fontlist = os.path.join(config_dir,
+                            f'fontlist-v{font_manager.FontManager.__version__}.json')
+    font_manager.json_dump(font_manager.fontManager, fontlist)
+
+    snapshot = {
+        'format': SNAPSHOT_FORMAT,
+        'matplotlib': mpl.__version__,
+        'style': _style_signature(),
+        'fontlist': os.path.basename(fontlist),
+        'fonts': {name: _resolve_preset_fonts(name) for name in PRESETS},
+        'rcparams': {name: _compile_preset(name) for name in PRESETS},
+    }
+    path = os.path.join(directory, 'snapshot.json')
+    with open(path, 'w') as f:
+        json.dump(snapshot, f, ensure_ascii=False, indent=1)
+    return path
+
+
+def _load_snapshot(directory: str) -> Optional[dict]:
+    """
+    スナップショットを読み込み、matplotlibのバージョン・プリセットの内容・
+    フォントファイルの存在だけを確認する（無効ならNone）
+    """
+    try:
+        with open(os.path.join(directory, 'snapshot.json')) as f:
+            snapshot = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning("スナップショットを読み込めません: %s", e)
+        return None
+    problems = []
+    if snapshot.get('format') != SNAPSHOT_FORMAT:
+        problems.append('形式')
+    if snapshot.get('matplotlib') != mpl.__version__:
+        problems.append(f"matplotlib {snapshot.get('matplotlib')} != {mpl.__version__}")
+    if snapshot.get('style') != _style_signature():
+        problems.append('プリセットの内容')
+    config_dir = (_snapshot_mplconfigdir if _snapshot_mplconfigdir is not None
+                  else os.path.join(directory, 'mplconfig'))
+    # matplotlibはMPLCONFIGDIRのシンボリックリンクを解決する
+    if os.path.realpath(mpl.get_cachedir()) != os.path.realpath(config_dir):
+        problems.append('MPLCONFIGDIR（matplotlibがmpl_configより先にimportされた可能性）')
+    if not os.path.exists(os.path.join(config_dir, str(snapshot.get('fontlist')))):
+        problems.append('フォント一覧のキャッシュ')
+    missing = [font for fonts in snapshot.get('fonts', {}).values() for font in fonts
+               if not os.path.exists(font)]
+    if missing:
+        problems.append(f"フォントファイル {', '.join(missing)}")
+    if problems:
+        logger.warning("スナップショットが無効です（%s）: %s", '; '.join(problems), directory)
+        return None
+    return snapshot
+
+
+def _apply_snapshot_style(preset_name: str) -> bool:
+    """スナップショットのrcParamsでプリセットを適用（なければFalse）"""
+    if _snapshot is None or preset_name not in _snapshot['rcparams']:
+        return False
+    plt.rcParams.update(_snapshot['rcparams'][preset_name])
+    global _current_style
+    _current_style = (preset_name, _freeze_settings(_style_settings(preset_name)))
+    optimize_math_rendering(preset_name)
+    return True
+
+
+# 作成済みの図のスタイル変更
+# restyleで各図に最後に適用したスタイルの値（次回の変更の基準）
+_figure_styles: 'weakref.WeakKeyDictionary' = weakref.WeakKeyDictionary()
+
+# 文字サイズとして解決するrcParamsのキー（'large'などの相対指定をポイントに変換）
+_RESTYLE_FONT_KEYS = ('font.size', 'axes.titlesize', 'axes.labelsize',
+                      'xtick.labelsize', 'ytick.labelsize', 'legend.fontsize',
+                      'figure.titlesize', 'figure.labelsize')
+
+# そのまま参照するrcParamsのキー
+_RESTYLE_KEYS = ('lines.linewidth', 'lines.markersize', 'lines.markeredgewidth',
+                 'patch.linewidth', 'axes.linewidth', 'axes.labelpad', 'grid.linewidth',
+                 'figure.figsize', 'figure.dpi',
+                 'axes.spines.left', 'axes.spines.right',
+                 'axes.spines.top', 'axes.spines.bottom',
+                 *(f'{axis}tick.{key}' for axis in 'xy'
+                   for key in ('major.size', 'minor.size', 'major.width', 'minor.width',
+                               'major.pad', 'minor.pad', 'direction')))
+
+
+def _restyle_values() -> dict:
+    """アクティブなrcParamsからrestyleで使う値を取り出す"""
+    values = {key: plt.rcParams[key] for key in _RESTYLE_KEYS}
+    for key in _RESTYLE_FONT_KEYS:
+        values[key] = font_manager.FontProperties(
+            size=plt.rcParams[key]).get_size_in_points()
+    return values
+
+
+def _rescaled(value, old: float, new: float):
+    """元のスタイルの値と同じなら新しい値に、個別に変更された値は比率で拡大縮小"""
+    value = np.asarray(value, dtype=float)
+    scaled = value * (new / old) if old else value
+    result = np.where(np.isclose(value, old), new, scaled)
+    return float(result) if result.ndim == 0 else result
+
+
+def _restyle_text(text, old: float, new: float) -> None:
+    """テキストの文字サイズを変更"""
+    if text is not None:
+        text.set_fontsize(_rescaled(text.get_fontsize(), old, new))
+
+
+def _restyle_artists(ax, old: dict, new: dict) -> None:
+    """Axes内の線・マーカー・コレクション・パッチの太さとサイズを変更"""
+    line_keys = (('linewidth', 'lines.linewidth'), ('markersize', 'lines.markersize'),
+                 ('markeredgewidth', 'lines.markeredgewidth'))
+    for line in ax.lines:
+        for prop, key in line_keys:
+            value = getattr(line, f'get_{prop}')()
+            getattr(line, f'set_{prop}')(_rescaled(value, old[key], new[key]))
+
+    for collection in ax.collections:
+        # 線のコレクション（等高線を含む）はlines.linewidth、それ以外はpatch.linewidthが既定値
+        is_line = isinstance(collection, LineCollection) or (
+            isinstance(collection, mcontour.ContourSet) and not collection.filled)
+        key = 'lines.linewidth' if is_line else 'patch.linewidth'
+        collection.set_linewidths(_rescaled(collection.get_linewidths(), old[key], new[key]))
+        if isinstance(collection, mcollections.PathCollection) \
+                and old['lines.markersize'] > 0:
+            # 散布図のsは面積（ポイントの2乗）
+            sizes = collection.get_sizes()
+            if len(sizes):
+                ratio = new['lines.markersize'] / old['lines.markersize']
+                collection.set_sizes(sizes * ratio ** 2)
+
+    for patch in ax.patches:
+        patch.set_linewidth(_rescaled(patch.get_linewidth(),
+                                      old['patch.linewidth'], new['patch.linewidth']))
+
+
+def _restyle_axes(ax, old: dict, new: dict) -> None:
+    """1つのAxesの文字・目盛・スパイン・凡例をスタイルに合わせて変更"""
+    _restyle_artists(ax, old, new)
+
+    # 文字サイズ（役割ごと）
+    for title in (ax.title, getattr(ax, '_left_title', None),
+                  getattr(ax, '_right_title', None)):
+        _restyle_text(title, old['axes.titlesize'], new['axes.titlesize'])
+    for axis, name in ((ax.xaxis, 'x'), (ax.yaxis, 'y')):
+        _restyle_text(axis.label, old['axes.labelsize'], new['axes.labelsize'])
+        axis.labelpad = _rescaled(axis.labelpad, old['axes.labelpad'],
+                                  new['axes.labelpad'])
+        _restyle_text(axis.get_offset_text(), old[f'{name}tick.labelsize'],
+                      new[f'{name}tick.labelsize'])
+    for text in ax.texts:
+        _restyle_text(text, old['font.size'], new['font.size'])
+
+    # 目盛（既存の目盛と今後作られる目盛の両方に反映される）
+    for axis, name in ((ax.xaxis, 'x'), (ax.yaxis, 'y')):
+        for which in ('major', 'minor'):
+            ticks = (axis.get_major_ticks(numticks=1) if which == 'major'
+                     else axis.get_minor_ticks(numticks=1))
+            prefix = f'{name}tick.{which}'
+            settings = {}
+            if ticks:
+                tick = ticks[0]
+                current = {'length': tick.tick1line.get_markersize(),
+                           'width': tick.tick1line.get_markeredgewidth(),
+                           'pad': tick.get_pad(),
+                           'labelsize': tick.label1.get_fontsize()}
+                keys = {'length': f'{prefix}.size', 'width': f'{prefix}.width',
+                        'pad': f'{prefix}.pad', 'labelsize': f'{name}tick.labelsize'}
+                settings = {prop: _rescaled(current[prop], old[key], new[key])
+                            for prop, key in keys.items()}
+            else:
+                settings = {'length': new[f'{prefix}.size'], 'width': new[f'{prefix}.width'],
+                            'pad': new[f'{prefix}.pad'],
+                            'labelsize': new[f'{name}tick.labelsize']}
+            ax.tick_params(axis=name, which=which, direction=new[f'{name}tick.direction'],
+                           grid_linewidth=new['grid.linewidth'], **settings)
+
+    # スパイン（表示・非表示は元のスタイルのままのものだけ変更）
+    for side, spine in ax.spines.items():
+        spine.set_linewidth(_rescaled(spine.get_linewidth(), old['axes.linewidth'],
+                                      new['axes.linewidth']))
+        key = f'axes.spines.{side}'
+        if key in new and spine.get_visible() == old[key]:
+            spine.set_visible(new[key])
+
+    # 凡例は枠や余白が文字サイズに依存するため、同じ項目・同じ設定・同じクラスで作り直す
+    legend = ax.get_legend()
+    if legend is not None:
+        handles, labels = ax.get_legend_handles_labels()
+        texts = [text.get_text() for text in legend.get_texts()]
+        if labels == texts or labels[::-1] == texts:
+            settings = _legend_settings(legend, old, new)
+            settings['reverse'] = labels != texts
+            colors = [text.get_color() for text in legend.get_texts()]
+            visible, zorder = legend.get_visible(), legend.get_zorder()
+            rebuilt = _make_legend(ax, type(legend), handles, labels, **settings)
+            for text, color in zip(rebuilt.get_texts(), colors):
+                text.set_color(color)
+            rebuilt.set_visible(visible)
+            rebuilt.set_zorder(zorder)
+        else:
+            _restyle_legend(legend, old, new)
+
+
+def _legend_settings(legend, old: dict, new: dict) -> dict:
+    """凡例を作り直すための引数（文字サイズと枠線の太さは比率で変更）"""
+    patch = legend.legendPatch
+    prop = legend.prop.copy()
+    prop.set_size(_rescaled(legend._fontsize, old['legend.fontsize'],
+                            new['legend.fontsize']))
+    title = legend.get_title()
+    title_prop = title.get_fontproperties().copy()
+    title_prop.set_size(_rescaled(title.get_fontsize(), old['legend.fontsize'],
+                                  new['legend.fontsize']))
+    # markerfirst は各項目の [ハンドル, テキスト] の並び順から判定する
+    items = [item for column in legend._legend_handle_box.get_children()
+             for item in column.get_children()]
+    markerfirst = not items or not isinstance(items[0].get_children()[0], moffsetbox.TextArea)
+    return {
+        'loc': legend._loc,
+        'bbox_to_anchor': legend._bbox_to_anchor,
+        'ncols': legend._ncols,
+        'mode': legend._mode,
+        'prop': prop,
+        'title': title.get_text() or None,
+        'title_fontproperties': title_prop,
+        'numpoints': legend.numpoints,
+        'markerscale': legend.markerscale,
+        'markerfirst': markerfirst,
+        'scatterpoints': legend.scatterpoints,
+        'scatteryoffsets': legend._scatteryoffsets,
+        'borderpad': legend.borderpad,
+        'labelspacing': legend.labelspacing,
+        'handlelength': legend.handlelength,
+        'handleheight': legend.handleheight,
+        'handletextpad': legend.handletextpad,
+        'borderaxespad': legend.borderaxespad,
+        'columnspacing': legend.columnspacing,
+        'fancybox': isinstance(patch.get_boxstyle(), mpatches.BoxStyle.Round),
+        'shadow': legend._shadow_props if legend.shadow else False,
+        'frameon': legend.get_frame_on(),
+        'framealpha': patch.get_alpha(),
+        # 透明（'none'）の色をRGBAで渡すとframealphaで不透明になるため'none'に戻す
+        'facecolor': 'none' if patch.get_facecolor()[3] == 0 else patch.get_facecolor(),
+        'edgecolor': 'none' if patch.get_edgecolor()[3] == 0 else patch.get_edgecolor(),
+        'linewidth': _rescaled(patch.get_linewidth(), old['patch.linewidth'],
+                               new['patch.linewidth']),
+        'handler_map': legend._custom_handler_map,
+        'alignment': legend._alignment,
+        'draggable': legend.get_draggable(),
+    }
+
+
+def _restyle_legend(legend, old: dict, new: dict) -> None:
+    """作り直せない凡例の文字サイズだけを変更"""
+    for text in legend.get_texts():
+        _restyle_text(text, old['legend.fontsize'], new['legend.fontsize'])
+    _restyle_text(legend.get_title(), old['legend.fontsize'], new['legend.fontsize'])
+
+
+def restyle(fig, preset_name: str, from_preset: Optional[str] = None, **kwargs):
+    """
+    作成済みの図を別のプリセットのスタイルに変更
+
+    データ・等高線・コレクションは作り直さず、文字サイズ（タイトル・軸ラベル・
+    目盛ラベル・凡例・テキスト）、線幅・マーカーサイズ、目盛、スパイン、
+    図のサイズをプリセットと共通設定に合わせる。元のスタイルの値のままの
+    要素は新しい値に、個別に指定された値は比率で拡大縮小する。
+    元のスタイルは前回のrestyleで適用したスタイル、初回はfrom_preset
+    （省略時は呼び出し時のrcParams）。
+    レイアウトエンジン（constrained/tight）を使う図は描画時に配置も再計算される。
+    描画プロファイル（間引き・アンチエイリアスなど）は作成時または描画時に
+    読まれるため、保存時のtemp_style(preset, profile=...)で指定する
+
+    Parameters:
+    -----------
+    fig : Figure
+        変更する図
+    preset_name : str
+        適用するプリセット
+    from_preset : str, optional
+        図を作成したときのプリセット（初回のrestyleでのみ参照）
+    **kwargs : dict
+        プリセットの値の上書き。restyleが変更するキー（_RESTYLE_KEYS,
+        _RESTYLE_FONT_KEYS）のみ指定でき、それ以外はValueError
+
+    Returns:
+    --------
+    Figure
+        変更した図（同じオブジェクト）
+
+    Example:
+    --------
+    with temp_style('paper'):
+        fig = make_figure()
+    for preset in ('paper', 'presentation'):
+        restyle(fig, preset, from_preset='paper')
+        with temp_style(preset):
+            fig.savefig(f'figure_{preset}.png')
+    """
+    unsupported = sorted(set(kwargs) - set(_RESTYLE_KEYS) - set(_RESTYLE_FONT_KEYS))
+    if unsupported:
+        raise ValueError(f"restyleで変更できない設定: {', '.join(unsupported)}")
+    old = _figure_styles.get(fig)
+    if old is None:
+        with temp_style(from_preset) if from_preset is not None else nullcontext():
+            old = _restyle_values()
+    with temp_style(preset_name, **kwargs):
+        new = _restyle_values()
+        # 凡例の作り直しは新しいスタイルのもとで行う
+        for ax in fig.axes:
+            _restyle_axes(ax, old, new)
+
+    for legend in fig.legends:
+        _restyle_legend(legend, old, new)
+    for text in fig.texts:
+        if text is getattr(fig, '_suptitle', None):
+            _restyle_text(text, old['figure.titlesize'], new['figure.titlesize'])
+        elif text in (getattr(fig, '_supxlabel', None), getattr(fig, '_supylabel', None)):
+            _restyle_text(text, old['figure.labelsize'], new['figure.labelsize'])
+        else:
+            _restyle_text(text, old['font.size'], new['font.size'])
+
+    # 図のサイズ（個別に指定されたサイズは縦横比を保って幅の比率で拡大縮小）
+    width, height = fig.get_size_inches()
+    old_width, old_height = old['figure.figsize']
+    new_width, new_height = new['figure.figsize']
+    if np.isclose(width, old_width) and np.isclose(height, old_height):
+        fig.set_size_inches(new_width, new_height, forward=False)
+    else:
+        scale = new_width / old_width
+        fig.set_size_inches(width * scale, height * scale, forward=False)
+    fig.set_dpi(new['figure.dpi'])
+    fig.stale = True
+
+    _figure_styles[fig] = new
+    return fig
+
+
+# 高速な凡例の配置
+# プリセットごとの凡例の配置方法。'grid'（粗い格子で占有率を数える）、
+# 'best'（matplotlib標準）、または 'upper right' などの固定位置
+LEGEND_PLACEMENT = {
+    'paper': 'grid',
+    'presentation': 'grid',
+    'presentation_large': 'grid',
+}
+LEGEND_GRID_SIZE = 64          # 占有率の格子の分割数（縦横）
+LEGEND_MAX_SAMPLES = 20_000    # 1つのアーティストから取り出す点の最大数
+
+
+def _sample_rows(points, max_samples: int):
+    """点列を等間隔に間引いて最大max_samples点にする（変換前に間引き、全点をコピーしない）"""
+    points = np.asarray(points).reshape(-1, 2)
+    step = -(-len(points) // max_samples)
+    return np.asarray(points[::step] if step > 1 else points, dtype=float)
+
+
+def _sample_polyline(vertices, spacing: float, max_samples: int):
+    """折れ線を弧長に沿って間隔spacingで標本化（頂点の少ない長い線分も格子を埋める）"""
+    vertices = _sample_rows(vertices, max_samples)
+    vertices = vertices[np.isfinite(vertices).all(axis=1)]
+    if len(vertices) < 2:
+        return vertices
+    arc = np.concatenate([[0.0], np.cumsum(np.hypot(*np.diff(vertices, axis=0).T))])
+    n = int(min(max_samples, arc[-1] / spacing + 1))
+    if n <= len(vertices):
+        return vertices
+    s = np.linspace(0.0, arc[-1], n)
+    return np.column_stack([np.interp(s, arc, vertices[:, 0]),
+                            np.interp(s, arc, vertices[:, 1])])
+
+
+def _legend_occupancy(ax, renderer, bounds: tuple, n: int) -> np.ndarray:
+    """
+    Axes内のアーティストの占有率をn×nの格子（表示座標）に集計
+
+    各アーティストの点はデータ座標で間引いてから表示座標に変換するため、
+    計算量はデータ量によらずほぼ一定
+    """
+    x0, y0, x1, y1 = bounds
+    spacing = min(x1 - x0, y1 - y0) / n / 2
+    points = []
+    boxes = []
+    # 背景・スパイン・凡例自身は占有物として数えない
+    excluded = {id(ax.patch), id(ax.get_legend()), *map(id, ax.spines.values())}
+    for artist in ax.get_children():
+        if not artist.get_visible() or id(artist) in excluded:
+            continue
+        if isinstance(artist, Line2D):
+            sample = _sample_rows(artist.get_xydata(), LEGEND_MAX_SAMPLES)
+            points.append(_sample_polyline(artist.get_transform().transform(sample),
+                                           spacing, LEGEND_MAX_SAMPLES))
+        elif isinstance(artist, mpatches.Rectangle):
+            boxes.append(artist.get_bbox().transformed(artist.get_data_transform()))
+        elif isinstance(artist, mpatches.Patch):
+            sample = _sample_rows(artist.get_path().vertices, LEGEND_MAX_SAMPLES)
+            points.append(_sample_polyline(artist.get_transform().transform(sample),
+                                           spacing, LEGEND_MAX_SAMPLES))
+        elif isinstance(artist, mcollections.Collection):
+            offsets = artist.get_offsets()
+            if isinstance(artist, mcollections.PathCollection) or len(offsets) > 1:
+                offsets = _sample_rows(offsets, LEGEND_MAX_SAMPLES)
+                points.append(artist.get_offset_transform().transform(offsets))
+            else:
+                # 線・ポリゴン・等高線は各パスを折れ線として扱う
+                paths = artist.get_paths()
+                per_path = max(2, LEGEND_MAX_SAMPLES // max(len(paths), 1))
+                transform = artist.get_transform()
+                points.extend(
+                    _sample_polyline(transform.transform(_sample_rows(path.vertices, per_path)),
+                                     spacing, per_path)
+                    for path in paths)
+        elif isinstance(artist, mtext.Text) and artist.get_text() \
+                and artist not in (ax.title, ax.xaxis.label, ax.yaxis.label):
+            boxes.append(artist.get_window_extent(renderer))
+
+    points = [p for p in points if len(p)]
+    if points:
+        xy = np.concatenate(points)
+        counts, _, _ = np.histogram2d(xy[:, 0], xy[:, 1], bins=n,
+                                      range=[[x0, x1], [y0, y1]])
+    else:
+        counts = np.zeros((n, n))
+    # 棒やテキストの範囲は覆うセルごとに1点として数える
+    for box in boxes:
+        i0, i1 = np.clip(((np.array([box.x0, box.x1]) - x0) / (x1 - x0) * n).astype(int),
+                         0, n - 1)
+        j0, j1 = np.clip(((np.array([box.y0, box.y1]) - y0) / (y1 - y0) * n).astype(int),
+                         0, n - 1)
+        counts[min(i0, i1):max(i0, i1) + 1, min(j0, j1):max(j0, j1) + 1] += 1
+    return counts
+
+
+def _area_sum(table, u: float, v: float) -> float:
+    """累積和の表を格子座標 (u, v) で双線形補間（セルの一部を覆う場合は面積比で数える）"""
+    n = table.shape[0] - 1
+    u, v = min(max(u, 0.0), n), min(max(v, 0.0), n)
+    i, j = min(int(u), n - 1), min(int(v), n - 1)
+    fu, fv = u - i, v - j
+    return ((1 - fu) * (1 - fv) * table[i, j] + fu * (1 - fv) * table[i + 1, j]
+            + (1 - fu) * fv * table[i, j + 1] + fu * fv * table[i + 1, j + 1])
+
+
+class GridLegend(mlegend.Legend):
+    """
+    loc='best'の位置を粗い格子の占有率で選ぶ凡例
+
+    matplotlib標準の'best'はすべての線の頂点・散布図の点と候補位置ごとに
+    交差判定するため、データ量に比例して遅くなる。GridLegendは各アーティストから
+    最大LEGEND_MAX_SAMPLES点を取り出してnp.histogram2dで格子に集計し、
+    累積和で9つの標準位置の重なりを定数時間で比較する
+    """
+
+    def _find_best_position(self, width, height, renderer):
+        parent = self.get_bbox_to_anchor()
+        bounds = (parent.x0, parent.y0, parent.x1, parent.y1)
+        n = LEGEND_GRID_SIZE
+        if parent.width <= 0 or parent.height <= 0:
+            return super()._find_best_position(width, height, renderer)
+        counts = _legend_occupancy(self.parent, renderer, bounds, n)
+        # 累積和（summed-area table）で候補位置の矩形内の合計をO(1)で求める
+        table = np.zeros((n + 1, n + 1))
+        table[1:, 1:] = counts.cumsum(axis=0).cumsum(axis=1)
+
+        bbox = mtransforms.Bbox.from_bounds(0, 0, width, height)
+        candidates = []
+        for idx in range(1, len(self.codes)):
+            l, b = self._get_anchored_bbox(idx, bbox, parent, renderer)
+            u0, u1 = (np.array([l, l + width]) - parent.x0) / parent.width * n
+            v0, v1 = (np.array([b, b + height]) - parent.y0) / parent.height * n
+            badness = (_area_sum(table, u1, v1) - _area_sum(table, u0, v1)
+                       - _area_sum(table, u1, v0) + _area_sum(table, u0, v0))
+            # 同点なら番号の小さい位置（matplotlibと同じ優先順、丸めて誤差の差を無視）
+            candidates.append((round(badness, 6), idx, (l, b)))
+        _, _, (l, b) = min(candidates)
+        return l, b
+
+
+def _make_legend(ax, legend_class, *args, **kwargs):
+    """ax.legendと同じ手順で指定したクラスの凡例を作成"""
+    handles, labels, kwargs = mlegend._parse_legend_args([ax], *args, **kwargs)
+    ax.legend_ = legend_class(ax, handles, labels, **kwargs)
+    ax.legend_._remove_method = ax._remove_legend
+    return ax.legend_
+
+
+def legend(ax, *args, placement: Optional[str] = None, **kwargs):
+    """
+    プリセットの配置方法で凡例を作成
+
+    Parameters:
+    -----------
+    ax : matplotlib.axes.Axes
+        凡例を付けるAxes
+    *args : tuple
+        ax.legendと同じ（handles, labels）
+    placement : str, optional
+        'grid'（GridLegend）、'best'（matplotlib標準）、または固定位置。
+        省略時は適用中のプリセットのLEGEND_PLACEMENT（なければ'grid'）
+    **kwargs : dict
+        ax.legendに渡す追加引数（locを指定した場合はそちらを優先）
+
+    Returns:
+    --------
+    Legend
+
+    Example:
+    --------
+    ax.scatter(x, y, label='data')  # 数十万点
+    mpl_config.legend(ax)
+    """
+    if placement is None:
+        preset_name = _current_style[0] if _current_style is not None else None
+        placement = LEGEND_PLACEMENT.get(preset_name, 'grid')
+    if placement == 'grid':
+        return _make_legend(ax, GridLegend, *args, **kwargs)
+    kwargs.setdefault('loc', placement)
+    return ax.legend(*args, **kwargs)
+
+
+# モジュールimport時に自動的にpresentationスタイルを適用
+if os.environ.get(SNAPSHOT_ENV):
+    _snapshot = _load_snapshot(os.environ[SNAPSHOT_ENV])
+if not _apply_snapshot_style('presentation'):
+    apply_style('presentation')
+
+
+# 使用例
+if __name__ == "__main__":
+    if len(sys.argv) == 3 and sys.argv[1] == 'snapshot':
+        print(f"スナップショットを作成しました: {build_snapshot(sys.argv[2])}")
+        sys.exit(0)
+
     print("利用可能なプリセット:")
     for preset in list_presets():
         print(f"  - {preset}")
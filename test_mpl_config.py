@@ -3,8 +3,21 @@
 シンプルなmatplotlib設定ライブラリのテスト
 """
 
+import gc
+import io
+import json
+import os
+import pickle
+import subprocess
+import sys
+import threading
+import weakref
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
 import numpy as np
+import pytest
 import matplotlib.pyplot as plt
+from PIL import Image
 import mpl_config
 
 
@@ -73,6 +86,840 @@ def test_temp_style():
     print("✓ 一時スタイル適用のテストが完了しました")
 
 
+def test_figure_scope():
+    """図のメモリ管理スコープのテスト"""
+    with mpl_config.figure_scope('paper', warn_threshold=1) as tracker:
+        plt.subplots()
+        with pytest.warns(RuntimeWarning):
+            plt.figure()
+        report = tracker.report()
+        assert report['open_figures'] == 2
+        assert report['memory_bytes'] == 2 * 1500 * 844 * 4
+    # auto_closeで閉じられている
+    assert len(tracker.figures) == 0
+
+    with pytest.raises(RuntimeError):
+        with mpl_config.figure_scope(max_figures=1):
+            plt.figure()
+            plt.figure()
+    assert plt.get_fignums() == []
+
+    # スコープ内で閉じた図は保持せず解放される
+    refs = []
+    with mpl_config.figure_scope() as tracker:
+        for _ in range(50):
+            fig, ax = plt.subplots()
+            ax.imshow(np.zeros((200, 200)))
+            refs.append(weakref.ref(fig))
+            plt.close(fig)
+            del fig, ax
+        tracker.check()
+        gc.collect()
+        assert len(tracker._figures) == 0
+        assert sum(ref() is not None for ref in refs) == 0
+        report = tracker.report()
+    if report['peak_rss'] is not None:
+        assert report['rss_delta'] >= 0
+        assert report['peak_rss'] >= tracker.start_rss
+
+    # 測定の合間に解放された一時的なピークも含まれる（新しいプロセスで確認）
+    code = (
+        "import json, numpy as np, mpl_config\n"
+        "with mpl_config.figure_scope() as tracker:\n"
+        "    np.ones(50_000_000).sum()\n"
+        "print(json.dumps(tracker.report()))\n"
+    )
+    output = subprocess.run([sys.executable, '-c', code], check=True, env=dict(
+        os.environ, MPLBACKEND='Agg'), cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True, text=True).stdout
+    report = json.loads(output)
+    if report['peak_rss'] is not None and mpl_config.resource is not None:
+        assert report['rss_delta'] > 300 * 2**20
+
+
+def _shared_sum(z, offset):
+    """並列描画テスト用のワーカー関数"""
+    return float(z.sum()) + offset, z.flags.owndata
+
+
+def _crash_worker(z):
+    """ワーカーのクラッシュを模擬"""
+    os._exit(1)
+
+
+def test_shared_array():
+    """共有メモリ配列のテスト"""
+    z = np.random.rand(600, 600)
+    with mpl_config.SharedArray(z) as shared:
+        # pickleされるのはハンドルのみで、復元側は同じメモリを参照する
+        attached = pickle.loads(pickle.dumps(shared))
+        assert not attached.array.flags.owndata
+        shared.array[0, 0] = -1.0
+        assert attached.array[0, 0] == -1.0
+        attached.close()
+    assert shared.closed
+
+    results = mpl_config.parallel_render(
+        _shared_sum, [(z, i) for i in range(3)], 'paper', max_workers=2)
+    assert [r[0] for r in results] == pytest.approx([z.sum() + i for i in range(3)])
+    # ワーカー側ではコピーではなくビューとして受け取る
+    assert not any(r[1] for r in results)
+
+    # ワーカーがクラッシュしても共有メモリは削除される
+    shared = mpl_config.SharedArray(z)
+    with pytest.raises(BrokenProcessPool):
+        mpl_config.parallel_render(_crash_worker, [(shared,)], max_workers=1)
+    shared.close()
+    with pytest.raises(FileNotFoundError):
+        shared_memory.SharedMemory(name=shared.name)
+
+
+def test_large_data_helpers(tmp_path):
+    """メモリマップ・チャンク読み込みによる大規模データ描画のテスト"""
+    mpl_config.apply_style('paper')
+    y = np.cumsum(np.random.randn(200_000))
+    np.save(tmp_path / 'y.npy', y)
+
+    fig, ax = plt.subplots()
+    line, = mpl_config.plot_large_line(ax, tmp_path / 'y.npy', chunk_size=30_000)
+    # 点数はピクセル列数×2以下に抑えられ、極値は保存される
+    assert len(line.get_ydata()) <= 2 * mpl_config._target_resolution(ax)[0]
+    assert line.get_ydata().min() == y.min()
+    assert line.get_ydata().max() == y.max()
+
+    image = mpl_config.scatter_density(ax, np.random.randn(50_000),
+                                       np.random.randn(50_000), bins=64,
+                                       chunk_size=7_000)
+    assert image.get_array().sum() == 50_000
+
+    plt.close(fig)
+
+    # 保存時のdpiを下げて、axesのピクセル数より大きい配列にする
+    z = np.random.rand(300, 500)
+    memmap = np.lib.format.open_memmap(tmp_path / 'z.npy', mode='w+', dtype=float,
+                                       shape=z.shape)
+    memmap[:] = z
+    memmap.flush()
+    with mpl_config.temp_style('paper', **{'savefig.dpi': 50}):
+        fig, ax = plt.subplots()
+        width, height = mpl_config._target_resolution(ax)
+        image = mpl_config.imshow_large(ax, tmp_path / 'z.npy', chunk_size=10_000)
+    fy, fx = -(-300 // height), -(-500 // width)
+    assert fy > 1 and fx > 1
+    reduced = image.get_array()
+    assert reduced.shape == (-(-300 // fy), -(-500 // fx))
+    assert reduced[0, 0] == pytest.approx(z[:fy, :fx].mean())
+    assert reduced[-1, -1] == pytest.approx(z[(reduced.shape[0] - 1) * fy:,
+                                              (reduced.shape[1] - 1) * fx:].mean())
+    assert tuple(image.get_extent()) == (-0.5, 499.5, 299.5, -0.5)
+    plt.close(fig)
+
+
+def test_live_plot():
+    """ブリッティングによるライブプロットのテスト"""
+    mpl_config.apply_style('presentation')
+    live = mpl_config.LivePlot(n_lines=2, capacity=100)
+    for i in range(300):
+        live.append(i, [np.sin(i / 10), np.cos(i / 10)])
+        live.update()
+
+    # リングバッファには最新のサンプルが時系列順に並ぶ
+    x, y = live.data()
+    assert np.array_equal(x, np.arange(200, 300))
+    assert np.allclose(y[0], np.sin(x / 10))
+    # 背景の再描画は範囲が変わったときだけ
+    assert live.n_background_draws < 40
+    plt.close(live.ax.figure)
+
+    # 系列数はlabelsから決まり、食い違う指定は図を作る前に拒否する
+    live = mpl_config.LivePlot(labels=['a', 'b'], capacity=10)
+    live.append(0, [1.0, 2.0])
+    assert [line.get_label() for line in live.lines] == ['a', 'b']
+    plt.close(live.ax.figure)
+    n_figures = len(plt.get_fignums())
+    with pytest.raises(ValueError):
+        mpl_config.LivePlot(n_lines=2, labels=['a'])
+    assert len(plt.get_fignums()) == n_figures
+
+
+def _animation_frame(i, z):
+    """アニメーション書き出しテスト用のフレーム関数"""
+    fig, ax = plt.subplots(figsize=(2, 1.5), dpi=50)
+    ax.imshow(z * np.cos(i / 5), vmin=-1, vmax=1)
+    return fig
+
+
+def test_export_animation(tmp_path):
+    """アニメーションの並列書き出しのテスト"""
+    z = np.random.rand(20, 20)
+    stats = mpl_config.export_animation(_animation_frame, 6, tmp_path / 'anim.gif',
+                                        'paper', args=(z,), max_workers=2,
+                                        max_in_flight=2)
+    assert stats['frames'] == 6
+    assert stats['fps'] > 0
+    with Image.open(tmp_path / 'anim.gif') as image:
+        assert image.n_frames == 6
+        assert image.size == (100, 75)
+
+    mpl_config.export_animation(_animation_frame, range(3),
+                                str(tmp_path / 'frame_{:02d}.png'), args=(z,),
+                                max_workers=2)
+    assert sorted(p.name for p in tmp_path.glob('frame_*.png')) == [
+        'frame_00.png', 'frame_01.png', 'frame_02.png']
+
+
+def test_plot_series():
+    """LineCollectionによる多系列描画のテスト"""
+    mpl_config.apply_style('paper')
+    Y = np.cumsum(np.random.randn(300, 50), axis=1)
+
+    fig, ax = plt.subplots()
+    collection = mpl_config.plot_series(ax, Y, cmap='viridis')
+    assert len(ax.lines) == 0
+    assert len(collection.get_segments()) == 300
+    assert collection.get_linewidth()[0] == plt.rcParams['lines.linewidth']
+    # 凡例は要求されたときだけ作成される
+    assert ax.get_legend() is None
+    plt.close(fig)
+
+    fig, axes = mpl_config.small_multiples([Y[:10]] * 5, labels=['a', 'b'],
+                                           legend=True)
+    assert axes.shape == (2, 3)
+    assert not axes[1, 2].get_visible()
+    assert len(axes[0, 0].get_legend().get_texts()) == 2
+    plt.close(fig)
+
+
+def test_errorbar_fast():
+    """高速エラーバーがax.errorbarと同じ見た目になることのテスト"""
+    rng = np.random.default_rng(0)
+    x, y = rng.uniform(0, 10, 100), rng.normal(size=100)
+    xerr, yerr = rng.uniform(0, 0.3, 100), rng.uniform(0, 0.3, (2, 100))
+
+    for preset in mpl_config.list_presets():
+        mpl_config.apply_style(preset)
+        images = []
+        for errorbar in (plt.Axes.errorbar, mpl_config.errorbar_fast):
+            fig, ax = plt.subplots(figsize=(4, 3), dpi=100)
+            container = errorbar(ax, x, y, xerr=xerr, yerr=yerr, fmt='o',
+                                 markersize=6, capsize=5, label='data')
+            ax.legend()
+            fig.canvas.draw()
+            images.append(np.asarray(fig.canvas.buffer_rgba()).copy())
+            plt.close(fig)
+        assert np.array_equal(images[0], images[1])
+        # バーは1つのLineCollection、キャップは方向ごとに1つのLine2D
+        assert len(container.lines[1]) == 2
+        assert len(container.lines[2]) == 1
+
+    # fmt='none'で色を指定した場合は色のサイクルを進めない
+    next_colors = []
+    for errorbar in (plt.Axes.errorbar, mpl_config.errorbar_fast):
+        fig, ax = plt.subplots()
+        errorbar(ax, x, y, yerr=yerr, fmt='none', color='k')
+        next_colors.append(ax.plot(x, y)[0].get_color())
+        plt.close(fig)
+    assert next_colors[0] == next_colors[1]
+
+
+def test_render():
+    """メモリ上での描画のテスト"""
+    fig, ax = plt.subplots()
+    ax.plot([0, 1, 2], [0, 1, 0])
+    result = mpl_config.render(fig, 'paper', dpi=100)
+    # RGBAバッファはコピーではなくレンダラーのビュー
+    assert not result.data.flags.owndata
+    assert result.data.shape == (result.height, result.width, 4)
+    # 呼び出しごとに別のレンダラーを使い、前の結果を上書きしない
+    first = result.data.copy()
+    again = mpl_config.render(fig, 'paper', dpi=100)
+    assert not np.shares_memory(result.data, again.data)
+    ax.plot([0, 2], [1, 1])
+    mpl_config.render(fig, 'paper', dpi=100)
+    assert np.array_equal(result.data, first)
+
+    result = mpl_config.render(fig, 'paper', format='png', dpi=50)
+    assert result.data[:8] == b'\x89PNG\r\n\x1a\n'
+    assert result.dpi == 50
+    # savefig.bbox・savefig.transparentはRGBAとPNGで同じように反映される
+    rgba = mpl_config.render(fig, 'paper', dpi=50)
+    assert (rgba.width, rgba.height) == (result.width, result.height)
+    assert rgba.width < 500
+    assert np.array_equal(np.asarray(Image.open(io.BytesIO(result.data))), rgba.data)
+    # ほかのラスター形式もエンコード後の実際のサイズ、ベクター形式はNone
+    for format in ('jpg', 'webp', 'tiff'):
+        encoded = mpl_config.render(fig, 'paper', format=format, dpi=50)
+        assert (encoded.width, encoded.height) == (rgba.width, rgba.height)
+        assert Image.open(io.BytesIO(encoded.data)).size == (rgba.width, rgba.height)
+    vector = mpl_config.render(fig, 'paper', format='svg')
+    assert (vector.width, vector.height) == (None, None)
+    plt.close(fig)
+
+    # 図を作る関数を渡した場合はプリセットの解像度で描画して閉じる
+    result = mpl_config.render(lambda: plt.subplots()[0], 'presentation',
+                               format='svg')
+    assert result.data.startswith(b'<?xml')
+    assert result.dpi == 300
+    assert plt.get_fignums() == []
+
+
+def test_render_cache():
+    """描画結果キャッシュのテスト"""
+    x = np.linspace(0, 1, 100)
+    calls = []
+
+    def make_figure():
+        calls.append(1)
+        fig, ax = plt.subplots(figsize=(2, 1))
+        ax.plot(x, x ** 2)
+        return fig
+
+    key = mpl_config.data_fingerprint(x, power=2)
+    assert key == mpl_config.data_fingerprint(x.copy(), power=2)
+    assert key != mpl_config.data_fingerprint(x, power=3)
+    # キーワード引数の配列も内容で区別する（reprが省略される大きな配列）
+    a = np.zeros((600, 2))
+    b = a.copy()
+    b[300] = 1.0
+    assert mpl_config.data_fingerprint(p=a) != mpl_config.data_fingerprint(p=b)
+    assert mpl_config.data_fingerprint(p=a) != mpl_config.data_fingerprint(q=a)
+
+    cache = mpl_config.RenderCache()
+    first = cache.get_or_render(make_figure, key, 'paper', dpi=50)
+    second = cache.get_or_render(make_figure, key, 'paper', dpi=50)
+    assert first.data == second.data
+    assert len(calls) == 1
+    # プリセットが変わればキーも変わる
+    cache.get_or_render(make_figure, key, 'presentation', dpi=50)
+    assert len(calls) == 2
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['entries']) == (1, 2, 2)
+
+    # 容量を超えると古いものから削除される
+    cache.max_bytes = stats['bytes'] - 1
+    cache.get_or_render(make_figure, key, 'paper', dpi=60)
+    assert cache.stats()['evictions'] >= 1
+    assert cache.stats()['bytes'] <= cache.max_bytes
+
+    # 有効期限切れ
+    cache = mpl_config.RenderCache(ttl=0)
+    cache.get_or_render(make_figure, key, 'paper', dpi=50)
+    cache.get_or_render(make_figure, key, 'paper', dpi=50)
+    assert cache.stats()['expirations'] == 1
+    assert plt.get_fignums() == []
+
+
+def test_render_profiles():
+    """描画プロファイルのテスト"""
+    assert mpl_config.list_profiles() == ['draft', 'fast', 'quality', 'archival']
+
+    with mpl_config.temp_style('paper', profile='draft'):
+        assert plt.rcParams['path.simplify_threshold'] == 1.0
+        assert plt.rcParams['font.size'] == 10
+    with mpl_config.temp_style('presentation', profile='archival'):
+        assert not plt.rcParams['path.simplify']
+        assert plt.rcParams['pdf.fonttype'] == 42
+        assert plt.rcParams['font.size'] == 14
+    # 個別の設定はプロファイルより優先される
+    with mpl_config.temp_style('paper', profile='fast', **{'pdf.fonttype': 42}):
+        assert plt.rcParams['pdf.fonttype'] == 42
+
+    with pytest.raises(ValueError):
+        mpl_config.apply_style('paper', profile='unknown')
+
+    # どのプロファイルも同じキーを設定する（前のプロファイルの値が残らない）
+    keys = [set(profile) for profile in mpl_config.RENDER_PROFILES.values()]
+    assert all(k == keys[0] for k in keys)
+    with mpl_config.temp_style('paper', profile='draft'):
+        mpl_config.apply_style('paper', profile='quality')
+        for key, value in mpl_config.RENDER_PROFILES['quality'].items():
+            assert plt.rcParams[key] == value
+        assert plt.rcParams['lines.antialiased']
+        assert plt.rcParams['text.hinting'] != 'no_hinting'
+
+    # プロファイルを省略するとデフォルトに戻り、同じスナップショットは同じ設定を表す
+    with mpl_config.temp_style('paper'):
+        snapshot = mpl_config.style_snapshot()
+        defaults = {key: plt.rcParams[key] for key in mpl_config.RENDER_PROFILES['draft']}
+    with mpl_config.temp_style('paper', profile='draft'):
+        mpl_config.apply_style('paper')
+        assert mpl_config.style_snapshot() == snapshot
+        for key, value in defaults.items():
+            assert plt.rcParams[key] == plt.rcParamsDefault[key] == value
+
+
+def test_math_spacing():
+    """スコープ単位の数式スペーシングのテスト"""
+    from matplotlib import _mathtext
+    from matplotlib.mathtext import MathTextParser
+
+    sup1 = _mathtext.ComputerModernFontConstants.sup1
+    mpl_config.apply_style('paper')
+    # フォント定数のクラスは書き換えない
+    assert _mathtext.ComputerModernFontConstants.sup1 == sup1
+
+    parser = MathTextParser('path')
+    with mpl_config.temp_style('paper', **{'mathtext.fontset': 'cm'}):
+        def width():
+            return parser.parse(r'$x_i^2 + y^2$', 100).width
+
+        base = width()
+        with mpl_config.math_spacing(delta=0.5, sup1=1.0):
+            scoped = width()
+        # スコープを抜けるとキャッシュ済みの元の結果に戻る
+        assert width() == base
+        assert scoped != base
+
+        # スレッドごとに異なるスペーシングで同時に描画しても混ざらない
+        results = {}
+
+        def run(delta):
+            with mpl_config.math_spacing(delta=delta):
+                results[delta] = {width() for _ in range(20)}
+
+        threads = [threading.Thread(target=run, args=(delta,))
+                   for delta in (0.01, 0.5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert results[0.01] == {base}
+        assert len(results[0.5]) == 1 and results[0.5] != {base}
+
+
+def test_guard_render():
+    """描画コストの見積もりとガードのテスト"""
+    with mpl_config.temp_style('paper'):
+        fig, ax = plt.subplots()
+        x = np.linspace(0, 1, 200_000)
+        ax.plot(x, np.sin(x * 50))
+        ax.scatter(x[:1000], x[:1000])
+        ax.imshow(np.zeros((100, 200)), extent=(0, 1, 0, 1))
+
+        estimate = mpl_config.estimate_render_cost(fig, dpi=100)
+        width, height = fig.get_size_inches() * 100
+        assert (estimate['width'], estimate['height']) == (round(width), round(height))
+        assert estimate['vertices'] >= 200_000
+        assert estimate['markers'] >= 1000  # 目盛りもマーカーとして数える
+        assert estimate['image_elements'] == 20_000
+        assert estimate['seconds'] > 0 and estimate['bytes'] > width * height * 4
+
+        with pytest.raises(mpl_config.RenderBudgetError):
+            mpl_config.guard_render(fig, policy='raise', max_seconds=1e-3)
+        with pytest.warns(RuntimeWarning):
+            mpl_config.guard_render(fig, policy='warn', max_seconds=1e-3)
+        with pytest.raises(ValueError):
+            mpl_config.guard_render(fig, policy='unknown')
+
+        # 上限内なら何も変更しない
+        unchanged = mpl_config.guard_render(fig, policy='decimate', max_seconds=None,
+                                            max_bytes=None, dpi=100)
+        assert unchanged['vertices'] == estimate['vertices']
+        with pytest.warns(RuntimeWarning):  # 固定コストのため間引いても上限を超える
+            reduced = mpl_config.guard_render(fig, policy='decimate', max_seconds=1e-3,
+                                              dpi=100)
+        assert reduced['vertices'] < estimate['vertices'] // 10
+        line = ax.get_lines()[0]
+        assert line.get_ydata().max() == pytest.approx(1.0, abs=1e-3)
+        plt.close(fig)
+
+        # 対数軸ではピクセル列を表示座標で決める（左側の細部も残る）
+        fig, ax = plt.subplots()
+        x = np.logspace(0, 6, 200_000)
+        ax.plot(x, np.sin(np.log(x) * 20))
+        ax.set_xscale('log')
+        with pytest.warns(RuntimeWarning):
+            mpl_config.guard_render(fig, policy='decimate', max_seconds=1e-3, dpi=100)
+        decimated = ax.get_lines()[0].get_xdata()
+        assert len(decimated) < 200_000 // 10
+        assert (decimated < 10).sum() > len(decimated) // 10
+        plt.close(fig)
+
+        # 散布図は重なる点を間引き、点ごとの色も合わせて間引く
+        rng = np.random.default_rng(0)
+        fig, ax = plt.subplots()
+        points = ax.scatter(rng.normal(size=200_000), rng.normal(size=200_000),
+                            c=rng.random(200_000), s=4)
+        before = mpl_config.estimate_render_cost(fig, dpi=100)
+        after = mpl_config.guard_render(fig, policy='decimate', max_seconds=1.0, dpi=100)
+        assert after['markers'] < before['markers'] // 2
+        assert after['seconds'] <= 1.0
+        assert len(points.get_array()) == len(points.get_offsets())
+
+        # ラスタ化ではAggの見積もりは下がらないため警告する
+        fig2, ax2 = plt.subplots()
+        ax2.scatter(rng.normal(size=200_000), rng.normal(size=200_000), c=rng.random(200_000))
+        with pytest.warns(RuntimeWarning, match='rasterize'):
+            mpl_config.guard_render(fig2, policy='rasterize', max_seconds=1.0, dpi=100)
+        plt.close(fig)
+        plt.close(fig2)
+
+
+def test_export_dpi_variants(tmp_path):
+    """複数解像度の書き出しのテスト"""
+    def make_figure():
+        fig, ax = plt.subplots(figsize=(4, 3))
+        ax.plot([0, 1], [0, 1])
+        return fig
+
+    result = mpl_config.export_dpi_variants(make_figure, str(tmp_path / 'fig.png'),
+                                            dpis=(50, 200, 100), preset_name='paper')
+    assert list(result['files']) == [200, 100, 50]
+    with Image.open(result['files'][200]) as image:
+        width, height = image.size
+    for dpi, path in result['files'].items():
+        assert path == str(tmp_path / f'fig_{dpi}dpi.png')
+        with Image.open(path) as image:
+            # tight bboxは最高解像度で1回だけ計算される
+            assert image.size == (round(width * dpi / 200), round(height * dpi / 200))
+            assert image.info['dpi'] == pytest.approx((dpi, dpi), rel=1e-3)
+            rgba = np.asarray(image.convert('RGBA'))
+        # paperプリセットは背景が透明
+        assert rgba[0, 0, 3] == 0
+
+    # 不透明な背景では縮小後も不透明のまま
+    fig = make_figure()
+    result = mpl_config.export_dpi_variants(fig, str(tmp_path / 'opaque_{dpi}.png'),
+                                            dpis=(120, 40), transparent=False,
+                                            facecolor='white')
+    with Image.open(result['files'][40]) as image:
+        assert np.asarray(image.convert('RGBA'))[..., 3].min() == 255
+    plt.close(fig)
+
+    with pytest.raises(ValueError):
+        mpl_config.export_dpi_variants(fig, str(tmp_path / 'fig.pdf'))
+
+
+def test_export(tmp_path):
+    """複数形式の書き出しのテスト"""
+    with mpl_config.temp_style('paper'):
+        fig, ax = plt.subplots(layout='constrained')
+        ax.plot([0, 1], [0, 1])
+        ax.set_title('export')
+        engine = fig.get_layout_engine()
+        fig.savefig(tmp_path / 'reference.png', dpi=100)
+
+        result = mpl_config.export(fig, str(tmp_path / 'fig'), formats=['png', 'pdf', 'svg'],
+                                   dpi=100)
+        assert result['files'] == {fmt: str(tmp_path / f'fig.{fmt}')
+                                   for fmt in ('png', 'pdf', 'svg')}
+        assert set(result['seconds']) == {'png', 'pdf', 'svg'}
+        assert result['total_seconds'] >= result['layout_seconds']
+        # レイアウトエンジンは元に戻る
+        assert fig.get_layout_engine() is engine
+
+    # tight bboxを1回だけ計算しても通常のsavefigと同じ大きさ
+    with Image.open(tmp_path / 'reference.png') as reference, \
+            Image.open(result['files']['png']) as image:
+        assert image.size == reference.size
+    with open(result['files']['pdf'], 'rb') as f:
+        assert f.read(4) == b'%PDF'
+    with open(result['files']['svg'], encoding='utf-8') as f:
+        assert '<svg' in f.read()
+
+    with pytest.raises(ValueError):
+        mpl_config.export(fig, str(tmp_path / 'fig'), formats=['png', 'unknown'])
+    plt.close(fig)
+
+
+def test_heatmap_pyramid(tmp_path):
+    """画像ピラミッドによるヒートマップのテスト"""
+    mpl_config.apply_style('paper')
+    rows, cols = np.mgrid[0:1000, 0:1200]
+    z = np.sin(rows / 50) * np.cos(cols / 70)
+    np.save(tmp_path / 'z.npy', z)
+
+    pyramid = mpl_config.ImagePyramid(tmp_path / 'z.npy', cache_dir=str(tmp_path / 'pyramid'),
+                                      min_size=100, chunk_size=50_000)
+    assert [level.shape for level in pyramid.levels] == [
+        (1000, 1200), (500, 600), (250, 300), (125, 150), (63, 75)]
+    assert pyramid.levels[1][0, 0] == pytest.approx(z[:2, :2].mean())
+    assert (pyramid.vmin, pyramid.vmax) == (z.min(), z.max())
+    # 元データが同じなら保存済みのレベルを再利用する
+    reloaded = mpl_config.ImagePyramid(tmp_path / 'z.npy', cache_dir=str(tmp_path / 'pyramid'),
+                                       min_size=100)
+    assert isinstance(reloaded.levels[1], np.memmap)
+    np.testing.assert_array_equal(reloaded.levels[2], pyramid.levels[2])
+
+    # min_size以下の入力でも新しいキャッシュディレクトリに書ける
+    small = np.random.default_rng(0).random((50, 50))
+    cached = mpl_config.ImagePyramid(small, cache_dir=str(tmp_path / 'new_dir'))
+    assert len(cached.levels) == 1
+    assert (cached.vmin, cached.vmax) == (small.min(), small.max())
+    assert (tmp_path / 'new_dir' / 'pyramid.json').exists()
+
+    fig, ax = plt.subplots(figsize=(3, 2.5))
+    image = mpl_config.heatmap_pyramid(ax, pyramid, cmap='viridis')
+    assert tuple(image.get_extent()) == (-0.5, 1199.5, 999.5, -0.5)
+    # 描画時のdpiに合わせてレベルが選ばれる
+    fig.canvas.draw()
+    coarse = image.drawn_level
+    fig.savefig(io.BytesIO(), format='png', dpi=400)
+    assert image.drawn_level < coarse
+    # 拡大表示では元データを使う
+    ax.set_xlim(100, 200)
+    ax.set_ylim(200, 100)
+    fig.canvas.draw()
+    assert image.drawn_level == 0
+    assert tuple(image.get_extent()) == (-0.5, 1199.5, 999.5, -0.5)
+
+    # 通常のimshowとほぼ同じ見た目
+    ax.set_xlim(-0.5, 1199.5)
+    ax.set_ylim(999.5, -0.5)
+    reference = np.asarray(mpl_config.render(fig, dpi=100).data).astype(int)
+    image.remove()
+    ax.imshow(z, cmap='viridis')
+    ax.set_xlim(-0.5, 1199.5)
+    ax.set_ylim(999.5, -0.5)
+    assert np.abs(np.asarray(mpl_config.render(fig, dpi=100).data) - reference).mean() < 2
+    plt.close(fig)
+
+
+def test_vector_field_helpers():
+    """流線のキャッシュと矢印の自動間引きのテスト"""
+    mpl_config.apply_style('presentation')
+    mpl_config.clear_streamline_cache()
+    x = np.linspace(-3, 3, 60)
+    X, Y = np.meshgrid(x, x)
+    u, v = -np.sin(Y), np.cos(X)
+
+    fig, (ax1, ax2, ax3) = plt.subplots(1, 3)
+    reference = ax1.streamplot(X, Y, u, v, density=1, color='blue')
+    result = mpl_config.streamplot_cached(ax2, X, Y, u, v, density=1, color='blue')
+    # matplotlibの積分と同じ流線・矢印
+    assert len(result.lines.get_segments()) == len(reference.lines.get_segments())
+    for ours, theirs in zip(result.lines.get_segments(), reference.lines.get_segments()):
+        np.testing.assert_allclose(ours, theirs)
+    assert len(ax2.patches) == len(ax1.patches)
+
+    # 同じフィールド・密度なら積分済みの流線を再利用する
+    assert len(mpl_config._streamline_cache) == 1
+    mpl_config.streamplot_cached(ax3, X, Y, u, v, density=1, color=np.hypot(u, v),
+                                 linewidth=np.hypot(u, v))
+    assert len(mpl_config._streamline_cache) == 1
+    mpl_config.streamplot_cached(ax3, X, Y, u, v, density=2)
+    assert len(mpl_config._streamline_cache) == 2
+
+    vectorized = mpl_config.streamplot_cached(ax3, X, Y, u, v, density=1, method='vectorized')
+    segments = vectorized.lines.get_segments()
+    assert len(segments) > len(reference.lines.get_segments()) // 2
+    points = np.concatenate(segments)
+    assert points.min() >= -3 - 1e-9 and points.max() <= 3 + 1e-9
+    with pytest.raises(ValueError):
+        mpl_config.streamplot_cached(ax3, X, Y, u, v, method='unknown')
+    with pytest.raises(TypeError):
+        mpl_config.streamplot_cached(ax3, X, Y, u, v, unknown=1)
+    plt.close(fig)
+
+    # 開始点は内容でキーを区別する（先頭・末尾だけが同じ大きな配列）
+    rng = np.random.default_rng(0)
+    seeds = rng.uniform(-2.9, 2.9, (600, 2))
+    other = seeds.copy()
+    other[3:-3] = rng.uniform(-2.9, 2.9, (594, 2))
+    fig, (ax1, ax2) = plt.subplots(1, 2)
+    for points in (seeds, other):
+        ours = mpl_config.streamplot_cached(ax1, X, Y, u, v, start_points=points)
+        theirs = ax2.streamplot(X, Y, u, v, start_points=points)
+        assert len(ours.lines.get_segments()) == len(theirs.lines.get_segments())
+        for a, b in zip(ours.lines.get_segments(), theirs.lines.get_segments()):
+            np.testing.assert_allclose(a, b)
+    plt.close(fig)
+
+    # 矢印の数はプリセットの図のサイズ・フォントサイズに応じて決まる
+    counts = {}
+    for preset in ('paper', 'presentation_large'):
+        with mpl_config.temp_style(preset):
+            fig, ax = plt.subplots()
+            counts[preset] = mpl_config.quiver_auto(ax, X, Y, u, v).N
+            assert mpl_config.quiver_auto(ax, x, x, u, v, spacing=1).N == u.size
+            plt.close(fig)
+    assert 1 < counts['presentation_large'] < counts['paper'] < u.size
+    mpl_config.clear_streamline_cache()
+
+
+def test_snapshot(tmp_path, monkeypatch):
+    """コールドスタート用スナップショットのテスト"""
+    root = os.path.dirname(os.path.abspath(__file__))
+    env = {key: value for key, value in os.environ.items()
+           if key not in ('MPLCONFIGDIR', mpl_config.SNAPSHOT_ENV)}
+    env['MPLBACKEND'] = 'Agg'
+    snapshot_dir = str(tmp_path / 'snapshot')
+    subprocess.run([sys.executable, '-m', 'mpl_config', 'snapshot', snapshot_dir],
+                   cwd=root, env=env, check=True, capture_output=True)
+    with open(os.path.join(snapshot_dir, 'snapshot.json')) as f:
+        snapshot = json.load(f)
+    assert set(snapshot['rcparams']) == set(mpl_config.list_presets())
+    assert snapshot['rcparams']['paper']['font.size'] == 10
+    assert os.listdir(os.path.join(snapshot_dir, 'mplconfig')) == [snapshot['fontlist']]
+
+    code = ("import mpl_config, matplotlib as mpl, matplotlib.pyplot as plt\n"
+            "loaded = mpl_config._snapshot is not None\n"
+            "before = dict(plt.rcParams)\n"
+            "mpl_config.apply_style('presentation')\n"
+            "same = before == dict(plt.rcParams)\n"
+            "print(loaded, same, mpl.get_cachedir())")
+    env[mpl_config.SNAPSHOT_ENV] = snapshot_dir
+    output = subprocess.run([sys.executable, '-c', code], cwd=root, env=env, check=True,
+                            capture_output=True, text=True).stdout.split()
+    # スナップショットのrcParamsはapply_styleと同じ結果になる
+    assert output == ['True', 'True', os.path.join(snapshot_dir, 'mplconfig')]
+
+    # シンボリックリンク経由でも使える（matplotlibはリンクを解決する）
+    link = str(tmp_path / 'link')
+    os.symlink(snapshot_dir, link)
+    output = subprocess.run([sys.executable, '-c', code], cwd=root,
+                            env=dict(env, **{mpl_config.SNAPSHOT_ENV: link}), check=True,
+                            capture_output=True, text=True).stdout.split()
+    assert output[:2] == ['True', 'True']
+
+    # 読み取り専用のディレクトリはフォント一覧を書き込める場所にコピーして使う
+    mplconfig = os.path.join(snapshot_dir, 'mplconfig')
+    monkeypatch.setattr(mpl_config.os, 'access', lambda path, mode: False)
+    copied = mpl_config._snapshot_config_dir(snapshot_dir)
+    monkeypatch.undo()
+    assert copied != mplconfig and os.listdir(copied) == [snapshot['fontlist']]
+    if os.geteuid() != 0:
+        os.chmod(mplconfig, 0o555)
+        try:
+            output = subprocess.run([sys.executable, '-c', code], cwd=root, env=env,
+                                    check=True, capture_output=True, text=True).stdout.split()
+        finally:
+            os.chmod(mplconfig, 0o755)
+        assert output[:2] == ['True', 'True']
+
+    # スナップショットの作成は適用中のスタイルを変えない
+    with mpl_config.temp_style('paper'):
+        style, spacing = mpl_config.style_snapshot(), mpl_config._default_math_spacing
+        mpl_config._compile_preset('presentation_large')
+        assert mpl_config.style_snapshot() == style
+        assert mpl_config._default_math_spacing == spacing
+
+    # プリセットの内容が変わったスナップショットは使わない
+    snapshot['style'] = 'outdated'
+    with open(os.path.join(snapshot_dir, 'snapshot.json'), 'w') as f:
+        json.dump(snapshot, f)
+    output = subprocess.run([sys.executable, '-c', code], cwd=root, env=env, check=True,
+                            capture_output=True, text=True).stdout.split()
+    assert output[:2] == ['False', 'True']
+
+
+def test_restyle():
+    """作成済みの図のスタイル変更のテスト"""
+    x = np.linspace(0, 10, 100)
+
+    def build(linewidth=4):
+        fig, ax = plt.subplots()
+        ax.plot(x, np.sin(x), label='sin')
+        ax.plot(x, np.cos(x), linewidth=linewidth, label='cos')
+        ax.scatter(x[:10], x[:10])
+        ax.set_title('Title')
+        ax.set_xlabel('x')
+        ax.legend()
+        return fig
+
+    with mpl_config.temp_style('paper'):
+        fig = build()
+    mpl_config.restyle(fig, 'presentation_large', from_preset='paper')
+    ax = fig.axes[0]
+    preset = mpl_config.PRESETS['presentation_large']
+    assert ax.lines[0].get_linewidth() == preset['lines.linewidth']
+    # 個別に指定した線幅は比率で拡大
+    assert np.isclose(ax.lines[1].get_linewidth(), 4 * 3.0 / 1.5)
+    assert ax.title.get_fontsize() == preset['axes.titlesize']
+    assert ax.xaxis.label.get_fontsize() == preset['axes.labelsize']
+    assert ax.get_legend().get_texts()[0].get_fontsize() == preset['legend.fontsize']
+    assert all(spine.get_linewidth() == preset['axes.linewidth']
+               for spine in ax.spines.values())
+
+    # 作り直した図と同じ描画結果になる
+    with mpl_config.temp_style('presentation_large'):
+        restyled = mpl_config.render(fig, dpi=50).data.copy()
+        rebuilt = build(linewidth=8)
+        expected = mpl_config.render(rebuilt, dpi=50).data
+    plt.close(rebuilt)
+    assert np.array_equal(restyled, expected)
+
+    # 2回目以降は前回のスタイルが基準になる
+    mpl_config.restyle(fig, 'paper')
+    assert ax.lines[0].get_linewidth() == mpl_config.PRESETS['paper']['lines.linewidth']
+    assert np.isclose(ax.lines[1].get_linewidth(), 4)
+    plt.close(fig)
+
+    # Axesの外に置いた凡例や個別に指定した値は保たれる（文字サイズは比率で拡大）
+    with mpl_config.temp_style('paper'):
+        fig, ax = plt.subplots()
+        ax.plot(x, np.sin(x), marker='o', label='sin')
+        ax.legend(loc='upper left', bbox_to_anchor=(1.02, 1), fontsize=6,
+                  framealpha=0.2, markerscale=2, handlelength=3, borderaxespad=0)
+        ax.tick_params(axis='x', labelsize=5)
+    mpl_config.restyle(fig, 'presentation_large', from_preset='paper')
+    fig.canvas.draw()
+    legend = ax.get_legend()
+    assert legend.get_window_extent().x0 > ax.get_window_extent().x1
+    assert np.isclose(legend.get_texts()[0].get_fontsize(), 6 * 18 / 10)
+    assert legend.legendPatch.get_alpha() == 0.2
+    assert legend.markerscale == 2
+    assert legend.handlelength == 3
+    assert legend.borderaxespad == 0
+    assert ax.xaxis.get_major_ticks()[0].label1.get_fontsize() == 5 * 20 / 10
+    assert ax.yaxis.get_major_ticks()[0].label1.get_fontsize() == 20
+
+    # 上書きできるのはrestyleが変更するキーだけ（プロファイルは描画時に指定する）
+    mpl_config.restyle(fig, 'paper', **{'lines.linewidth': 0.5})
+    assert ax.lines[0].get_linewidth() == 0.5
+    for kwargs in ({'profile': 'draft'}, {'lines.antialiased': False}):
+        with pytest.raises(ValueError):
+            mpl_config.restyle(fig, 'paper', **kwargs)
+    plt.close(fig)
+
+
+def test_grid_legend():
+    """格子による凡例の配置のテスト"""
+    x = np.linspace(0, 1, 200)
+    for y, expected in ((x, 'upper left'), (1 - x, 'upper right'),
+                        (np.full_like(x, 0.95), 'lower right')):
+        fig, ax = plt.subplots()
+        ax.plot(x, y, label='line')
+        ax.set_ylim(0, 1)
+        best = ax.legend(loc='best')
+        fig.canvas.draw()
+        best_box = best.get_window_extent()
+        legend = mpl_config.legend(ax, placement='grid')
+        assert isinstance(legend, mpl_config.GridLegend)
+        assert ax.get_legend() is legend
+        fig.canvas.draw()
+        # matplotlib標準の'best'と同じ位置
+        assert np.allclose(legend.get_window_extent().get_points(),
+                           best_box.get_points()), expected
+        plt.close(fig)
+
+    # 密な散布図（上半分）を避けて下側に置く
+    rng = np.random.default_rng(0)
+    fig, ax = plt.subplots()
+    ax.scatter(rng.uniform(0, 1, 50_000), rng.uniform(0.4, 1, 50_000), s=1, label='points')
+    ax.set_xlim(0, 1)
+    ax.set_ylim(0, 1)
+    legend = mpl_config.legend(ax)
+    fig.canvas.draw()
+    assert isinstance(legend, mpl_config.GridLegend)
+    box = legend.get_window_extent().transformed(ax.transAxes.inverted())
+    assert box.y1 < 0.4
+
+    # 固定位置のプリセット、locの明示
+    original = mpl_config.LEGEND_PLACEMENT.copy()
+    try:
+        mpl_config.LEGEND_PLACEMENT['paper'] = 'lower left'
+        with mpl_config.temp_style('paper'):
+            legend = mpl_config.legend(ax)
+        assert type(legend) is not mpl_config.GridLegend
+        assert legend._loc == 3
+        assert mpl_config.legend(ax, placement='best', loc='center')._loc == 10
+    finally:
+        mpl_config.LEGEND_PLACEMENT.clear()
+        mpl_config.LEGEND_PLACEMENT.update(original)
+    plt.close(fig)
+
+
 if __name__ == "__main__":
     print("matplotlib設定ライブラリ（シンプル版）のテストを開始します...\n")
     